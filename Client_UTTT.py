@@ -1,11 +1,14 @@
 import board
 import client
 import bots
+import protocol
+import transport
 import argparse
 
-def main(bot, host, port, args):
+def main(bot, host, port, args, version=protocol.VERSION, unix=None):
     B = board.Board()
-    c = client.Client(make_bot(B, bot, args), host=host, port=port)
+    c = client.Client(make_bot(B, bot, args), host=host, port=port, version=version,
+                      transport=transport.Unix(unix) if unix else None)
     try:
         c.start()
     finally:
@@ -24,9 +27,11 @@ if __name__ == '__main__':
     parser.add_argument("bot_name", help="Name of the player or bot to use")
     parser.add_argument("--host", default=None, help="Hostname of the host module")
     parser.add_argument("--port", type=int, default=11001, help="Port to communicate over")
+    parser.add_argument("--unix", default=None, help="Connect to the host's Unix socket at this path instead of TCP")
+    parser.add_argument("--protocol", type=int, default=protocol.VERSION, help="Protocol version (1 for hosts that predate protocol.py)")
     parser.add_argument("bot_args", nargs='*', help="Other arguments for the bot")
 
     args = parser.parse_args()
 
     bot = bots.get_bot(args.bot_name)
-    main(bot, args.host, args.port, args.bot_args)
+    main(bot, args.host, args.port, args.bot_args, args.protocol, args.unix)
@@ -1,11 +1,15 @@
 import server
+import async_server
 import board
+import transport
 import argparse
+import os
 
-def main(fname, host, port):
+def main(fname, host, port, game_time=None, move_time=None, unix=None):
     with open(fname, 'w') as f:
         B = BoardRecorder(f)
-        s = server.Server(B, host=host, port=port)
+        s = server.Server(B, host=host, port=port, game_time=game_time, move_time=move_time,
+                          transport=transport.Unix(unix) if unix else None)
         try:
             s.start()
         finally:
@@ -14,6 +18,20 @@ def main(fname, host, port):
             print('########\n')
             s.close()
 
+def main_concurrent(fname, host, port, games, game_time=None, move_time=None, unix=None):
+    # Any number of matches at once, each with its own replay file
+    root, ext = os.path.splitext(fname)
+    s = async_server.Server(host=host, port=port, games=games, replay=root + '-{}' + ext,
+                            game_time=game_time, move_time=move_time, unix=unix)
+    try:
+        s.start()
+    finally:
+        print("Latency over all matches: {}".format(s.latency.summary()))
+        s.latency.pprint()
+        print('\n########')
+        print("Shutting server down...")
+        print('########\n')
+
 class BoardRecorder(board.Board):
     def __init__(self, file):
         super(BoardRecorder, self).__init__()
@@ -27,6 +45,14 @@ if __name__ == '__main__':
     parser.add_argument("--host", default=None, help="Hostname of the host module")
     parser.add_argument("--port", type=int, default=11001, help="Port to communicate over")
     parser.add_argument("--replay", default="moves.dat", help="Filename to save the replay to")
+    parser.add_argument("--concurrent", action='store_true', help="Pair up any number of clients into concurrent matches")
+    parser.add_argument("--games", type=int, default=None, help="With --concurrent, stop after this many matches")
+    parser.add_argument("--unix", default=None, help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--game-time", type=float, default=None, help="Seconds on each player's game clock")
+    parser.add_argument("--move-time", type=float, default=None, help="Seconds allowed per move")
 
     args = parser.parse_args()
-    main(args.replay, args.host, args.port)
+    if args.concurrent:
+        main_concurrent(args.replay, args.host, args.port, args.games, args.game_time, args.move_time, args.unix)
+    else:
+        main(args.replay, args.host, args.port, args.game_time, args.move_time, args.unix)
@@ -0,0 +1,213 @@
+"""
+Tournaments between bots.
+
+Each bot is given as a spec: its bots.get_bot name followed by its
+arguments, in one quoted string. Every game is played in-process with
+transport.local_match, spread over a pool of worker processes, and the
+pairs swap colours every game.
+
+        python3 arena.py "mcts" "mcts 0 32" "mctsplus batch:32 ucb" --games 100 --move-time 1
+
+plays every pair of bots 100 times (--gauntlet plays only the first bot
+against each of the others). Every game is appended to the results file
+as a JSON line as soon as it finishes, so a long run can be stopped at
+any time, and the standings are written next to it (results.txt by
+default). Re-running over an existing results file plays only the games
+it is missing; --report just prints the standings from it.
+
+Scores count a win as 1 and a tie as 1/2. Elo differences come from the
+score as -400 log10(1/score - 1), with 95% confidence intervals from
+the Wilson score interval of the mean score (which stays finite at a
+score of 0% or 100%).
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+from collections import OrderedDict
+from multiprocessing import Pool
+from time import time
+
+import numpy as np
+import transport
+
+def parse_spec(spec):
+    # (name, args) for a "name arg1 arg2 ..." spec
+    words = spec.split()
+    return words[0], words[1:]
+
+def pairings(specs, gauntlet=False):
+    # The pairs of specs that play each other
+    if gauntlet:
+        return [(specs[0], other) for other in specs[1:]]
+    return [(a, b) for i, a in enumerate(specs) for b in specs[i+1:]]
+
+def schedule(specs, games, gauntlet=False):
+    # Jobs of (pair, game, first spec, second spec), swapping colours every game
+    jobs = []
+    for pair, (a, b) in enumerate(pairings(specs, gauntlet)):
+        for game in range(games):
+            first, second = (a, b) if game % 2 == 0 else (b, a)
+            jobs.append((pair, game, first, second))
+    return jobs
+
+def check_specs(specs):
+    # Set up each bot once, so a bad spec fails here
+    # rather than in every game of the tournament
+    import bots
+    from board import Board
+    with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+        for spec in specs:
+            name, args = parse_spec(spec)
+            try:
+                bots.get_bot(name)(Board(), 1, *args)
+            except Exception as e:
+                raise ValueError("Bot '{}' failed to set up: {!r}".format(spec, e))
+
+def _init_worker():
+    # Forked workers would otherwise share their random state
+    random.seed()
+    np.random.seed()
+
+def play(job, game_time=None, move_time=None):
+    pair, game, first, second = job
+    start = time()
+    result = {'pair': pair, 'game': game, 'player1': first, 'player2': second}
+    try:
+        result['winner'] = transport.local_match(parse_spec(first), parse_spec(second),
+                                                 game_time=game_time, move_time=move_time)
+    except Exception as e:
+        result['winner'] = None
+        result['error'] = repr(e)
+    result['time'] = time() - start
+    return result
+
+class _Player:
+    # Picklable play() with the time controls bound
+    def __init__(self, game_time, move_time):
+        self.game_time = game_time
+        self.move_time = move_time
+
+    def __call__(self, job):
+        return play(job, self.game_time, self.move_time)
+
+def load(fname):
+    # The results recorded so far
+    if not os.path.exists(fname):
+        return []
+    with open(fname) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def run(specs, games, fname, gauntlet=False, processes=None, game_time=None, move_time=None):
+    """ Play the tournament's missing games, appending them to the results file """
+    done = {(r['player1'], r['player2'], r['game']) for r in load(fname) if r.get('winner') is not None}
+    jobs = [job for job in schedule(specs, games, gauntlet) if (job[2], job[3], job[1]) not in done]
+    print("{} games to play ({} already done) on {} processes".format(
+        len(jobs), len(done), processes or os.cpu_count()))
+
+    start = time()
+    pool = Pool(processes, initializer=_init_worker)
+    try:
+        with open(fname, 'a') as f:
+            for i, result in enumerate(pool.imap_unordered(_Player(game_time, move_time), jobs)):
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+                f.flush()
+                if 'error' in result:
+                    print("Game {} failed: {}".format(i + 1, result['error']))
+                print("{}/{} games, {:.1f} games/min".format(
+                    i + 1, len(jobs), 60 * (i + 1) / (time() - start)), end='\r', flush=True)
+    finally:
+        pool.terminate()
+    print()
+
+def elo(score):
+    # Elo difference for an expected score
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def rate(scores, z=1.96):
+    """ (mean score, Elo, Elo low, Elo high) from per-game scores (95% CI) """
+    n = len(scores)
+    mean = sum(scores) / n
+    # Wilson score interval
+    center = (mean + z*z / (2*n)) / (1 + z*z / n)
+    margin = z / (1 + z*z / n) * math.sqrt(mean * (1 - mean) / n + z*z / (4*n*n))
+    return mean, elo(mean), elo(center - margin), elo(center + margin)
+
+def standings(results, specs=None):
+    """ Lines of the standings table for the results """
+    results = [r for r in results if r.get('winner') is not None]
+    if specs is not None:
+        results = [r for r in results if r['player1'] in specs and r['player2'] in specs]
+    else:
+        specs = list(OrderedDict.fromkeys(s for r in results for s in (r['player1'], r['player2'])))
+
+    # Per-game scores of every bot, and of every bot against every other
+    overall = {spec: [] for spec in specs}
+    versus = {}
+    first_wins = ties = 0
+    for r in results:
+        scores = {r['player1']: 0.5, r['player2']: 0.5}
+        if r['winner'] == 0:
+            ties += 1
+        else:
+            winner = r['player{}'.format(r['winner'])]
+            loser = r['player{}'.format(3 - r['winner'])]
+            scores = {winner: 1.0, loser: 0.0}
+            first_wins += r['winner'] == 1
+        for spec, score in scores.items():
+            other = r['player2'] if spec == r['player1'] else r['player1']
+            overall.setdefault(spec, []).append(score)
+            versus.setdefault((spec, other), []).append(score)
+
+    lines = ["{} games: player 1 won {}, player 2 won {}, {} ties".format(
+        len(results), first_wins, len(results) - first_wins - ties, ties)]
+    lines.append("")
+    lines.append("{:30s} {:>6s} {:>7s} {:>7s} {:>18s}".format("bot", "games", "score", "Elo", "95% CI"))
+    ranked = sorted((spec for spec in overall if overall[spec]),
+                    key=lambda spec: -sum(overall[spec]) / len(overall[spec]))
+    for spec in ranked:
+        mean, diff, low, high = rate(overall[spec])
+        lines.append("{:30s} {:6d} {:6.1f}% {:+7.0f} {:>18s}".format(
+            spec, len(overall[spec]), 100 * mean, diff, "[{:+.0f}, {:+.0f}]".format(low, high)))
+    lines.append("(Elo against the bots it played)")
+    lines.append("")
+    lines.append("{:30s} {:30s} {:>6s} {:>7s} {:>7s} {:>18s}".format("bot", "opponent", "games", "score", "Elo", "95% CI"))
+    for (spec, other), scores in sorted(versus.items(), key=lambda item: (ranked.index(item[0][0]), ranked.index(item[0][1]))):
+        if ranked.index(spec) > ranked.index(other):
+            continue
+        mean, diff, low, high = rate(scores)
+        lines.append("{:30s} {:30s} {:6d} {:6.1f}% {:+7.0f} {:>18s}".format(
+            spec, other, len(scores), 100 * mean, diff, "[{:+.0f}, {:+.0f}]".format(low, high)))
+    return lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tournaments between Ultimate Tic-Tac-Toe bots")
+    parser.add_argument("specs", nargs='*', help='Bots to play, as "name [args*]" (eg. "mcts 0 32")')
+    parser.add_argument("--games", type=int, default=10, help="Games per pair of bots")
+    parser.add_argument("--gauntlet", action='store_true', help="Play only the first bot against each of the others")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (all cores by default)")
+    parser.add_argument("--game-time", type=float, default=None, help="Seconds on each player's game clock")
+    parser.add_argument("--move-time", type=float, default=None, help="Seconds allowed per move")
+    parser.add_argument("--results", default="results.jsonl", help="File the games are appended to")
+    parser.add_argument("--report", action='store_true', help="Only print the standings from the results file")
+
+    args = parser.parse_args()
+    if not args.report:
+        if len(args.specs) < 2:
+            parser.error("need at least two bots")
+        if len(set(args.specs)) < len(args.specs):
+            parser.error("the bots must all be different specs")
+        try:
+            check_specs(args.specs)
+        except ValueError as e:
+            parser.error(str(e))
+        run(args.specs, args.games, args.results, args.gauntlet, args.processes, args.game_time, args.move_time)
+
+    lines = standings(load(args.results), args.specs or None)
+    print('\n'.join(lines))
+    if not args.report:
+        with open(os.path.splitext(args.results)[0] + '.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
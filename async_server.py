@@ -0,0 +1,289 @@
+"""
+Ultimate Tic-Tac-Toe host for many games at once.
+
+Clients connect to a single port, exactly as for server.Server, and are
+paired in the order they arrive. Every pair plays a match on its own
+Board with the packets described in server.py (or the frames in
+protocol.py, for clients that ask for them), and all the matches run
+concurrently on one asyncio event loop, so one process can host
+hundreds of bot-vs-bot games.
+
+A player that disconnects, sends a bad packet, makes an invalid move
+or runs out of time (see the time controls in server.py) forfeits the
+match.
+"""
+import asyncio
+import os
+import socket
+import struct
+from time import time
+from board import Board
+from latency import Histogram
+from socket_helper import pack
+import protocol
+
+class Player:
+    """
+    One end of a match: the client's streams, its player number
+    and the protocol version it speaks
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.number = None
+        self.version = 1
+        self.clock = None
+        self.latency = Histogram()
+
+    def send(self, *args):
+        self.writer.write(pack(*args))
+
+    def write(self, data):
+        self.writer.write(data)
+
+    async def flush(self):
+        await self.writer.drain()
+
+    async def recv(self, size):
+        return await self.reader.readexactly(size)
+
+    async def recv_int(self):
+        return (await self.reader.readexactly(1))[0]
+
+    def close(self):
+        self.writer.close()
+
+class Forfeit(Exception):
+    """ Raised in a match when a player breaks it, naming that player """
+    def __init__(self, player, reason):
+        super(Forfeit, self).__init__(reason)
+        self.player = player
+
+class Server:
+    def __init__(self, host=None, port=11001, games=None, replay=None, verbose=True,
+                 game_time=None, move_time=None, unix=None, handshake_timeout=30):
+        """
+        :param games: Stop after this many matches (None to serve forever)
+        :param replay: File name pattern for the match replays,
+            formatted with the match number (eg. 'moves-{}.dat')
+        :param game_time: Seconds on each player's game clock (None for no clock)
+        :param move_time: Seconds allowed per move (None for no limit)
+        :param unix: Listen on this Unix socket path instead of the host and port
+        :param handshake_timeout: Seconds a player has to acknowledge its
+            player id (None to wait forever)
+        """
+        if host is None:
+            host = socket.gethostname()
+        self._host = host
+        self._port = port
+        self._unix = unix
+        self._games = games
+        self._replay = replay
+        self._verbose = verbose
+        self._game_time = game_time
+        self._move_time = move_time
+        self._handshake_timeout = handshake_timeout
+
+        self._waiting = []
+        self._started = 0
+        self._finished = 0
+        self._done = None
+
+        # Winner (0 for a tie) of every finished match, by match number
+        self.results = {}
+        # Request to move latency over all the matches
+        self.latency = Histogram()
+
+    def start(self):
+        """ Serve until the number of games is reached (or forever) """
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.serve())
+        finally:
+            loop.close()
+
+    async def serve(self):
+        self._done = asyncio.Event()
+        if self._unix is not None:
+            if os.path.exists(self._unix):
+                os.unlink(self._unix)
+            server = await asyncio.start_unix_server(self._accept, self._unix, backlog=1024)
+            self._log("Hosting matches on unix:{}".format(self._unix))
+        else:
+            server = await asyncio.start_server(self._accept, self._host, self._port,
+                                                reuse_address=True, backlog=1024)
+            self._log("Hosting matches on {}:{}".format(self._host, self._port))
+        try:
+            await self._done.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    async def _accept(self, reader, writer):
+        # Pair the client with the one waiting, if any,
+        # and play their match on this task
+        for player in self._waiting:
+            if player.reader.at_eof():
+                # (it hung up while waiting)
+                player.close()
+        self._waiting = [player for player in self._waiting if not player.reader.at_eof()]
+        self._waiting.append(Player(reader, writer))
+        if len(self._waiting) < 2:
+            return
+        players = self._waiting[:2]
+        del self._waiting[:2]
+        self._started += 1
+        await self._play(self._started, players)
+
+    async def _play(self, number, players):
+        board = Board()
+        moves = []
+        last_player, last_move = 0, None
+        self._log("Match {}: {} vs {}".format(number, players[0].address, players[1].address))
+        try:
+            await self._connect(players)
+            for player in players:
+                player.clock = self._game_time
+            while board.winner is None:
+                player = players[board.player - 1]
+                start = time()
+                if player.version == 1:
+                    player.send(0)
+                else:
+                    player.write(protocol.turn(last_player, last_move, player.clock, self._move_time))
+                await self._flush(player)
+                move = await self._receive_timed_move(player, start)
+                try:
+                    board.move(*move)
+                except (AssertionError, ValueError, IndexError) as e:
+                    raise Forfeit(player, "invalid move {}: {}".format(move, e))
+                moves.append(move)
+                last_player, last_move = player.number, move
+
+                # (v2 players get the move with their next turn)
+                for other in players:
+                    if other.version == 1:
+                        other.send(1, player.number, len(move), *move)
+                        await self._flush(other)
+            winner = board.winner
+            result = "a tie" if winner == 0 else "player {} wins".format(winner)
+        except Forfeit as e:
+            winner = 3 - e.player.number
+            # (both players have seen the last move)
+            last_player, last_move = 0, None
+            result = "player {} forfeits ({})".format(e.player.number, e)
+
+        for player in players:
+            try:
+                if player.version == 1:
+                    player.send(10, winner)
+                else:
+                    player.write(protocol.game_over(winner, last_player, last_move))
+                await player.flush()
+            except ConnectionError:
+                pass
+            player.close()
+
+        self._log("Match {}: {} after {} moves".format(number, result, len(moves)))
+        for player in players:
+            self._log("  Player {} latency: {}".format(player.number, player.latency.summary()))
+            self.latency.merge(player.latency)
+        if self._replay is not None:
+            with open(self._replay.format(number), 'w') as f:
+                for row, col in moves:
+                    f.write('({},{})\n'.format(row, col))
+
+        self.results[number] = winner
+        self._finished += 1
+        if self._games is not None and self._finished >= self._games:
+            self._done.set()
+
+    async def _connect(self, players):
+        # Give out the player numbers and wait for both to be ready
+        for number, player in enumerate(players, 1):
+            player.number = number
+            player.send(4, number)
+        for player in players:
+            await self._flush(player)
+        for player in players:
+            header = await self._receive_handshake(player, player.recv_int())
+            if header == protocol.ACK_V2:
+                player.version = await self._receive_handshake(player, player.recv_int())
+                if player.version != protocol.VERSION:
+                    raise Forfeit(player, "unknown protocol version {}".format(player.version))
+            elif header != protocol.ACK:
+                raise Forfeit(player, "bad acknowledgement")
+
+    async def _receive_handshake(self, player, read):
+        # Await a handshake read, which must come within the timeout
+        try:
+            return await self._receive(player, asyncio.wait_for(read, self._handshake_timeout))
+        except asyncio.TimeoutError:
+            raise Forfeit(player, "no acknowledgement after {}s".format(self._handshake_timeout))
+
+    async def _receive_timed_move(self, player, start):
+        # The player's move, charged to its clock, which must not run out
+        limits = [t for t in (player.clock, self._move_time) if t is not None]
+        limit = max(0, min(limits)) if limits else None
+        try:
+            move = await asyncio.wait_for(self._receive_move(player), limit)
+        except asyncio.TimeoutError:
+            move = None
+        elapsed = time() - start
+        player.latency.add(elapsed)
+        if player.clock is not None:
+            player.clock -= elapsed
+        if move is None or (limit is not None and elapsed > limit):
+            raise Forfeit(player, "out of time after {:.3f}s".format(elapsed))
+        return move
+
+    async def _receive_move(self, player):
+        if player.version != 1:
+            return await self._receive_move_v2(player)
+
+        # MOVE: HEADER (2), SIZEOF(OPTION), OPTION (see server.py)
+        header = await self._receive(player, player.recv_int())
+        if header != 2:
+            raise Forfeit(player, "expected a move, got header {}".format(header))
+        size = await self._receive(player, player.recv_int())
+        if size != 2:
+            raise Forfeit(player, "expected a (row, col) move, got {} bytes".format(size))
+        move = tuple(await self._receive(player, player.recv(size)))
+        if max(move) >= 9:
+            raise Forfeit(player, "move {} is off the board".format(move))
+        return move
+
+    async def _receive_move_v2(self, player):
+        # MOVE frame (see protocol.py)
+        size = await self._receive(player, player.recv_int())
+        if size == 0:
+            raise Forfeit(player, "empty frame")
+        payload = await self._receive(player, player.recv(size))
+        try:
+            kind, fields = protocol.parse(payload)
+            if kind != protocol.MOVE:
+                raise ValueError("expected a move, got frame type {}".format(kind))
+            move = protocol.decode_move(fields[0])
+            if move is None:
+                raise ValueError("no move")
+            return move
+        except (ValueError, struct.error) as e:
+            raise Forfeit(player, str(e))
+
+    async def _receive(self, player, read):
+        # Await a read, blaming the player if the connection breaks
+        try:
+            return await read
+        except (asyncio.IncompleteReadError, ConnectionError):
+            raise Forfeit(player, "disconnected")
+
+    async def _flush(self, player):
+        try:
+            await player.flush()
+        except ConnectionError:
+            raise Forfeit(player, "disconnected")
+
+    def _log(self, *args):
+        if self._verbose:
+            print(*args, flush=True)
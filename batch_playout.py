@@ -0,0 +1,130 @@
+"""
+Lockstep batch playouts.
+
+Plays N random games at once from the same Board, one ply per step,
+with the games held in NumPy arrays:
+    cells       (N, 9, 9)   cells by mini-board (0 empty, 1 or 2)
+    miniwins    (N, 9)      mini-board results (0 open, 1 or 2 won, 3 tied)
+    active      (N,)        board that must be played in (-1 for any)
+    player      (N,)        player to move
+Finished games are dropped from the arrays as soon as they end, so each
+step only pays for the games still running.
+"""
+import numpy as np
+from winning_state import WIN_ARRAY, POWERS
+from board import board_iter, _bit_index
+
+BOARDS = np.arange(9)
+
+def playout(board, n, random=np.random.random_sample, record=False):
+    """
+    Play n random games from the board, returning an array of the
+    n winners (0 for a tie, 1 or 2). The board is not modified.
+    With record, also returns the final cells of every game as an
+    (n, 81) array indexed by board bit (see board.py).
+    """
+    winners = np.zeros(n, dtype='uint8')
+    if board.winner is not None:
+        winners[:] = board.winner
+        if record:
+            return winners, state_arrays(board, n)[0].reshape(n, 81)
+        return winners
+
+    cells, miniwins, active, player = state_arrays(board, n)
+    final = cells.reshape(n, 81).copy() if record else None
+    games = np.arange(n)
+    while len(games):
+        rows = np.arange(len(games))
+
+        # Legal moves: empty cells of open boards, in the active board if there is one
+        playable = (miniwins == 0) & ((active[:, None] < 0) | (active[:, None] == BOARDS))
+        legal = (cells == 0) & playable[:, :, None]
+
+        # Pick a random legal move in every game
+        choice = np.argmax((random((len(games), 81)) + 1) * legal.reshape(-1, 81), axis=1)
+        b, i = np.divmod(choice, 9)
+        cells[rows, b, i] = player
+
+        # Update the mini-board that was played in
+        mini = cells[rows, b]
+        won = WIN_ARRAY[(mini == player[:, None]) @ POWERS]
+        full = (mini != 0).all(axis=1)
+        miniwins[rows, b] = np.where(won, player, np.where(full, 3, 0))
+
+        # Check the main board
+        big_win = WIN_ARRAY[(miniwins == player[:, None]) @ POWERS]
+        big_tie = (miniwins != 0).all(axis=1)
+        done = big_win | big_tie
+        winners[games[big_win]] = player[big_win]
+
+        # Send the next player to the board matching the cell
+        active = np.where(miniwins[rows, i] == 0, i, -1)
+        player = 3 - player
+
+        if done.any():
+            if record:
+                final[games[done]] = cells[done].reshape(-1, 81)
+            keep = ~done
+            games, cells, miniwins, active, player = games[keep], cells[keep], miniwins[keep], active[keep], player[keep]
+    if record:
+        return winners, final
+    return winners
+
+def cell_array(board):
+    # The board's cells as an array indexed by board bit (0 empty, 1 or 2)
+    position = board.snapshot()
+    cells = np.zeros(81, dtype='uint8')
+    for player, mask in ((1, position.cells1), (2, position.cells2)):
+        bits = np.unpackbits(np.frombuffer(mask.to_bytes(11, 'little'), dtype='uint8'), bitorder='little')
+        cells[bits[:81] == 1] = player
+    return cells
+
+def state_arrays(board, n):
+    # Arrays for n copies of the board (see the module docstring)
+    cells = cell_array(board).reshape(9, 9)
+    miniwins = np.zeros(9, dtype='uint8')
+    position = board.snapshot()
+    for b in range(9):
+        if position.macro1 >> b & 1:
+            miniwins[b] = 1
+        elif position.macro2 >> b & 1:
+            miniwins[b] = 2
+        elif position.closed >> b & 1:
+            miniwins[b] = 3
+
+    if position.next_board is None:
+        active = -1
+    else:
+        br, bc = position.next_board
+        active = 3*br + bc
+
+    return (np.repeat(cells[None], n, axis=0),
+            np.repeat(miniwins[None], n, axis=0),
+            np.full(n, active, dtype=int),
+            np.full(n, board.player, dtype='uint8'))
+
+# Board bit of each cell, by 9*row + col
+BITS = np.array([_bit_index(r, c) for r, c in board_iter(9)])
+
+def amaf_counts(winners, final):
+    """
+    AMAF counts for RAVE from playout results (one winner or an array)
+    and final cells (an (n, 81) array, see playout). Returns (played, won),
+    two (3, 81) arrays where played[p][9*row + col] is the number of games
+    in which player p took the cell and won[p][...] those of them p won.
+    """
+    winners = np.reshape(winners, -1)
+    final = final.reshape(len(winners), 81)[:, BITS]
+    played = np.zeros((3, 81), dtype='int32')
+    won = np.zeros((3, 81), dtype='int32')
+    for p in (1, 2):
+        mine = final == p
+        played[p] = mine.sum(axis=0)
+        won[p] = mine[winners == p].sum(axis=0)
+    return played, won
+
+def tally(winners, player):
+    # (wins, games) for the player from one winner or an array of winners
+    if isinstance(winners, np.ndarray):
+        return int(np.count_nonzero(winners == player)), len(winners)
+    return int(winners == player), 1
@@ -1,96 +1,283 @@
 import numpy as np
-from winning_state import winning_state
+from collections import namedtuple
+from random import choice, randrange, Random
+from winning_state import WINS, FULL
+
+class Position(namedtuple('Position', [
+        'free', 'cells1', 'cells2', 'macro1', 'macro2', 'closed',
+        'next_board', 'last_move', 'winner', 'player', 'turns_left', 'hash'])):
+    """
+    Immutable snapshot of a Board.
+    Snapshots only hold ints and tuples, so they can be hashed, compared
+    and shared between boards without copying. Two snapshots are equal
+    when their games are: the same cells, boards and player to move,
+    however they were reached (last_move and hash are left out).
+    Positions have no order, since the tuple order would depend on
+    the fields equality leaves out.
+    """
+    __slots__ = ()
+
+    def state(self):
+        # The fields that make up the game, for equality
+        return (self.free, self.cells1, self.cells2, self.macro1, self.macro2, self.closed,
+                self.next_board, self.winner, self.player, self.turns_left)
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self.state() == other.state()
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.state())
+
+    def _unordered(self, other):
+        return NotImplemented
+
+    __lt__ = __le__ = __gt__ = __ge__ = _unordered
 
 class Board:
+    """
+    Ultimate Tic-Tac-Toe board stored as bitboards.
+
+    Each player owns an 81-bit cell mask made of nine 9-bit mini-board
+    masks: cell (row, col) is bit 9*b + i, where b = 3*(row//3) + col//3
+    is the mini-board and i = 3*(row%3) + col%3 is the cell inside it.
+    The macro board is kept the same way, with one 9-bit mask of won
+    mini-boards per player and one mask of finished (won or tied) boards.
+
+    _free holds the empty cells of the unfinished mini-boards and is kept
+    up to date by move(), so the legal moves never need to be searched for.
+
+    push() and pop() play and take back moves in place, so a search can
+    walk the tree on a single board. Clones start with an empty undo stack.
+
+    All of the state is held in a few ints, so boards are slotted and
+    clone() only allocates the new object. snapshot() returns the state as
+    an immutable Position.
+
+    hash is the Zobrist hash of the position (cells, active board and
+    player to move), updated by move(). See zobrist().
+    """
+    __slots__ = ('_free', '_cells1', '_cells2', '_macro1', '_macro2', '_closed',
+                 '_next_board', '_last_move', 'winner', 'player', 'turns_left', 'hash', '_history')
+
     def __init__(self):
-        self._board = np.zeros((9,9), dtype='uint8')
-        self._miniwins = np.zeros((3,3), dtype='uint8')
+        self._free = ALL_CELLS
+        self._cells1 = 0
+        self._cells2 = 0
+        self._macro1 = 0
+        self._macro2 = 0
+        self._closed = 0
         self._next_board = None
         self._last_move = None
         self.winner = None
         self.player = 1
         self.turns_left = 81
+        self.hash = _ZOBRIST_BOARD[None]
+        self._history = None
 
     def clone(self):
-        B = Board()
-        B._board = self._board.copy()
-        B._miniwins = self._miniwins.copy()
+        B = Board.__new__(Board)
+        B._free = self._free
+        B._cells1 = self._cells1
+        B._cells2 = self._cells2
+        B._macro1 = self._macro1
+        B._macro2 = self._macro2
+        B._closed = self._closed
         B._next_board = self._next_board
         B.winner = self.winner
         B.player = self.player
         B.turns_left = self.turns_left
         B._last_move = self._last_move
+        B.hash = self.hash
+        B._history = None
+        return B
+
+    def snapshot(self):
+        """ The current state as an immutable Position """
+        return Position(self._free, self._cells1, self._cells2, self._macro1, self._macro2, self._closed,
+                        self._next_board, self._last_move, self.winner, self.player, self.turns_left, self.hash)
+
+    def restore(self, position):
+        """ Reset the board to a Position taken with snapshot() """
+        (self._free, self._cells1, self._cells2, self._macro1, self._macro2, self._closed,
+         self._next_board, self._last_move, self.winner, self.player, self.turns_left, self.hash) = position
+
+    @classmethod
+    def from_snapshot(cls, position):
+        B = cls.__new__(cls)
+        B.restore(position)
+        B._history = None
         return B
 
     def move(self, row, col, player=None):
         if player is None:
             player = self.player
         (br, mr), (bc, mc) = divmod(row,3), divmod(col,3)
+        b = 3*br + bc
+        shift = 9*b
+        bit = 1 << (shift + 3*mr + mc)
 
         assert self._next_board is None or (br,bc) == self._next_board, "Must play in the active board"
-        assert self._board[row, col] == 0, "That cell is taken"
-        assert self._miniwins[br, bc] == 0, "That board already has a winner"
+        assert not (self._cells1 | self._cells2) & bit, "That cell is taken"
+        assert not self._closed >> b & 1, "That board already has a winner"
 
         self._last_move = row, col
+        self._free &= ~bit
+        key = self.hash ^ _ZOBRIST_CELLS[player][shift + 3*mr + mc] ^ _ZOBRIST_BOARD[self._next_board]
 
-        self._board[row, col] = player
+        if player == 1:
+            self._cells1 |= bit
+            mine = self._cells1 >> shift & FULL
+        else:
+            self._cells2 |= bit
+            mine = self._cells2 >> shift & FULL
         self.turns_left -= 1
 
         # Check if the miniboard has a win
-        miniboard = self._get_miniboard(br, bc)
-        miniwin = winning_state(miniboard, player)
-        if miniwin:
-            self._miniwins[br, bc] = miniwin
-            if self._miniwins[mr, mc] == 0:
-                self._next_board = mr, mc
+        if WINS[mine]:
+            self._closed |= 1 << b
+            self._free &= ~(FULL << shift)
+            if player == 1:
+                self._macro1 |= 1 << b
+                macro = self._macro1
             else:
-                self._next_board = None
+                self._macro2 |= 1 << b
+                macro = self._macro2
+        elif not self._free >> shift & FULL:
+            # Tied miniboard
+            self._closed |= 1 << b
+            macro = None
+        else:
+            macro = 0
+
+        # Make sure the next board doesn't have a winner
+        if self._closed >> (3*mr + mc) & 1:
+            self._next_board = None
+        else:
+            self._next_board = _BOARDS[3*mr + mc]
+        key ^= _ZOBRIST_BOARD[self._next_board]
+
+        if macro != 0:
             # Check if the main board has a win
-            big_win = winning_state(self._miniwins, player)
-            if big_win == player:
+            if macro is not None and WINS[macro]:
                 self.winner = player
             # Big game tie!
-            elif big_win > 0:
+            elif self._closed == FULL:
                 self.winner = 0
+                self.hash = key
                 return 0
-        else:
-            # Make sure that board doesn't have a winner
-            if self._miniwins[mr,mc] == 0:
-                self._next_board = mr, mc
-            else:
-                self._next_board = None
-
-            if self.turns_left == 0:
-                self.winner = 0
+        elif self.turns_left == 0:
+            self.winner = 0
 
         # Swap players
         self.player = 3 - self.player
+        self.hash = key ^ _ZOBRIST_PLAYER
 
         return self.winner
 
-    def _get_miniboard(self, br, bc):
-        return self._board[br*3:(br+1)*3, bc*3:(bc+1)*3]
+    def push(self, row, col):
+        """ Play a move that can be taken back with pop() """
+        position = self.snapshot()
+        winner = self.move(row, col)
+        if self._history is None:
+            self._history = []
+        self._history.append(position)
+        return winner
+
+    def pop(self):
+        """ Take back the last pushed move, returning it """
+        if not self._history:
+            raise IndexError("No moves to take back")
+        move = self._last_move
+        self.restore(self._history.pop())
+        return move
+
+    @property
+    def _board(self):
+        """ 9x9 array of the cells (0 empty, 1 or 2 for the player) """
+        board = np.zeros((9,9), dtype='uint8')
+        for r, c in board_iter(9):
+            bit = 1 << _bit_index(r, c)
+            if self._cells1 & bit:
+                board[r, c] = 1
+            elif self._cells2 & bit:
+                board[r, c] = 2
+        return board
+
+    @property
+    def _miniwins(self):
+        """ 3x3 array of the mini-board results (0 open, 1 or 2 won, 3 tied) """
+        miniwins = np.zeros((3,3), dtype='uint8')
+        for br, bc in board_iter(3):
+            b = 3*br + bc
+            if self._macro1 >> b & 1:
+                miniwins[br, bc] = 1
+            elif self._macro2 >> b & 1:
+                miniwins[br, bc] = 2
+            elif self._closed >> b & 1:
+                miniwins[br, bc] = 3
+        return miniwins
 
     def get_valid(self):
+        free = self._free
         if self._next_board is None:
-            return [(r,c) for r,c in board_iter(9) if self._board[r,c] == 0 and self._miniwins[r//3,c//3] == 0]
+            return [move for b in range(9) for move in _MOVES[b][free >> 9*b & FULL]]
         else:
             br, bc = self._next_board
-            return [(br*3+r,bc*3+c) for r,c in board_iter(3) if self._board[br*3+r,bc*3+c] == 0]
+            b = 3*br + bc
+            return list(_MOVES[b][free >> 9*b & FULL])
+
+    def num_valid(self):
+        """ Number of legal moves """
+        free = self._free
+        if self._next_board is None:
+            return sum(_COUNTS[free >> 9*b & FULL] for b in range(9))
+        br, bc = self._next_board
+        return _COUNTS[free >> 9*(3*br + bc) & FULL]
+
+    def random_valid(self):
+        """ A uniformly random legal move, without building the move list """
+        free = self._free
+        if self._next_board is not None:
+            br, bc = self._next_board
+            b = 3*br + bc
+            return choice(_MOVES[b][free >> 9*b & FULL])
+        k = randrange(self.num_valid())
+        for b in range(9):
+            moves = _MOVES[b][free >> 9*b & FULL]
+            if k < len(moves):
+                return moves[k]
+            k -= len(moves)
+
+    def valid_indices(self):
+        """ Legal moves as an array of flat indices (9*row + col) """
+        free = self._free
+        if self._next_board is None:
+            boards = range(9)
+        else:
+            br, bc = self._next_board
+            boards = [3*br + bc]
+        return np.array([i for b in boards for i in _INDICES[b][free >> 9*b & FULL]], dtype='uint8')
 
     def __repr__(self, lastmove=lambda s: s, miniwin=lambda s, w: s, active=lambda s: s):
+        board, miniwins = self._board, self._miniwins
         s = '\n '
         for i in range(9):
             for j in range(9):
                 if (i,j) == self._last_move:
-                    s += lastmove([' ','X','O'][self._board[i,j]])
+                    s += lastmove([' ','X','O'][board[i,j]])
                 else:
-                    s += [' ','X','O'][self._board[i,j]]
+                    s += [' ','X','O'][board[i,j]]
                 if j % 3 == 2:
                     s += ' '
                 elif j < 8:
-                    if self._miniwins[i//3,j//3]:
-                        s += miniwin('|', self._miniwins[i//3,j//3])
+                    if miniwins[i//3,j//3]:
+                        s += miniwin('|', miniwins[i//3,j//3])
                     else:
                         if self._next_board == (i//3,j//3):
                             s += active('|')
@@ -101,8 +288,8 @@ class Board:
                 s += '\n '
             else:
                 for k in range(3):
-                    if self._miniwins[i//3,k]:
-                        s += miniwin('-+-+- ', self._miniwins[i//3,k])
+                    if miniwins[i//3,k]:
+                        s += miniwin('-+-+- ', miniwins[i//3,k])
                     else:
                         if self._next_board == (i//3,k):
                             s += active('-+-+- ')
@@ -126,6 +313,42 @@ def board_iter(size):
         for c in range(size):
             yield r,c
 
+def _bit_index(row, col):
+    return 9*(3*(row//3) + col//3) + 3*(row%3) + col%3
+
+ALL_CELLS = (1 << 81) - 1
+
+# Lookup tables indexed by mini-board and 9-bit mask of cells in it
+_BOARDS = tuple(divmod(b, 3) for b in range(9))
+_COUNTS = tuple(bin(mask).count('1') for mask in range(512))
+_MOVES = tuple(
+    tuple(tuple((3*(b//3) + i//3, 3*(b%3) + i%3) for i in range(9) if mask >> i & 1)
+          for mask in range(512))
+    for b in range(9))
+_INDICES = tuple(
+    tuple(tuple(9*r + c for r, c in moves) for moves in board_moves)
+    for board_moves in _MOVES)
+
+# Zobrist keys, seeded so that hashes are stable between runs
+_random = Random(81)
+_ZOBRIST_CELLS = (None,
+                  tuple(_random.getrandbits(64) for _ in range(81)),
+                  tuple(_random.getrandbits(64) for _ in range(81)))
+_ZOBRIST_BOARD = {next_board: _random.getrandbits(64) for next_board in (None,) + _BOARDS}
+_ZOBRIST_PLAYER = _random.getrandbits(64)
+del _random
+
+def zobrist(position):
+    """ Zobrist hash of a Position, computed from scratch """
+    key = _ZOBRIST_BOARD[position.next_board]
+    if position.player == 2:
+        key ^= _ZOBRIST_PLAYER
+    for player, cells in ((1, position.cells1), (2, position.cells2)):
+        for k in range(81):
+            if cells >> k & 1:
+                key ^= _ZOBRIST_CELLS[player][k]
+    return key
+
 def pack(*args):
     return bytes(args)
 
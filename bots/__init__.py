@@ -4,6 +4,8 @@ import bots.mctscomplex
 import bots.mctspure
 import bots.interruptable
 import bots.cpybot
+import bots.book
+import bots.parallel
 
 def get_bot(name):
     return {
@@ -12,5 +14,7 @@ def get_bot(name):
         'mcts': mctspure.Bot,
         'mctsplus': mctscomplex.Bot,
         'interrupt': interruptable.Bot,
-        'cpy': cpybot.Bot
+        'cpy': cpybot.Bot,
+        'book': book.Bot,
+        'parallel': parallel.Bot
     }[name]
@@ -1,3 +1,9 @@
+from time import time
+import threading
+from bots import telemetry
+from bots.clock import describe
+from bots.solver import WIN, LOSS
+
 class BaseBot:
     """
     Base for all bots.
@@ -6,6 +12,15 @@ class BaseBot:
     If your bot has update actions, you should override the on_update method
     If your bot does not keep a running copy of the board, you should override update_board (NOT IMPLEMENTED)
     If you must override the default behaviour, you should use a super call
+    If your bot searches, you can report per-move metrics by overriding metrics
+    (see bots/telemetry.py)
+    If your bot thinks in the background, you should override search and
+    call ponder/think instead of starting your own thread. update pauses
+    the search, so on_update may re-root the tree without a lock. A search
+    step that can take long should give up when stopping() is true. Call
+    end_pondering in stop, so the thread exits however the game ended.
+    If your bot has a clock and an endgame solver (self.clock, self.solver
+    and self.solve_time), request can start with solved_move.
     """
 
     """
@@ -20,7 +35,7 @@ class BaseBot:
         pass
 
     def stop(self):
-        """ Called after the game is over """
+        """ Called after the game is over (or the connection to the host is lost) """
         pass
 
     def on_update(self, last_player, last_move):
@@ -35,14 +50,223 @@ class BaseBot:
         """ Called when the bot is expected to make a turn """
         raise NotImplementedError("Subclasses must override 'request()'")
 
+    def metrics(self):
+        """ Called once the move is sent when telemetry is on; returns a dict for the move """
+        return {}
+
+    def sync_clock(self, remaining, move_limit):
+        """
+        Called before request with the host's time controls: seconds left
+        on our game clock and for this move (None when there is none)
+        """
+        clock = getattr(self, 'clock', None)
+        if clock is not None:
+            clock.sync(remaining, move_limit)
+
+    def search(self):
+        """ Called over and over by the pondering thread; one step of the search """
+        raise NotImplementedError("Subclasses that ponder must override 'search()'")
+
     """
     Subclasses should not override these methods
     """
     def __init__(self, board, player, *args):
         self.board = board
         self.player = player
+        # Telemetry sink (None when it is off), and the record of the
+        # move being played
+        self.telemetry = telemetry.get_sink()
+        self._record = None
+
+        # Pondering thread state, guarded by the condition
+        self._ponder = threading.Condition()
+        self._pondering = False
+        self._searching = False
+        self._thread = None
+        # Set by end_pondering, for good
+        self._stopped = False
+        # What killed the pondering thread, raised again by stop_pondering
+        # or think
+        self._error = None
+        # Set by interrupt to cut a request's thinking short
+        self._interrupted = False
+        # Seconds a search step can take (a slowly decaying max), since
+        # the step running at a deadline has to finish before we move
+        self.step_time = 0.0
+
         self.setup(*args)
 
+    def play(self):
+        # Requests a move, keeping its telemetry record for report
+        start = time()
+        clock = getattr(self, 'clock', None)
+        reports = len(clock.reports) if clock is not None else 0
+        move = self.request()
+        if self.telemetry is not None:
+            record = {
+                'bot': type(self).__module__,
+                'player': self.player,
+                'ply': 81 - self.board.turns_left,
+                'move': list(move),
+                'time': time() - start,
+            }
+            if clock is not None and len(clock.reports) > reports:
+                record['stopped_by'] = clock.reports[-1].reason
+            self._record = record
+        return move
+
+    def report(self):
+        # Adds the metrics to the record of the move play returned and
+        # writes it to the telemetry sink. Called once the move is sent
+        # (and before it is applied), so the metrics are not on our clock
+        record, self._record = self._record, None
+        if record is not None:
+            record.update(self.metrics())
+            self.telemetry.write(record)
+
+    def solved_move(self, start):
+        # A proven win or draw when the endgame can be solved, charged to
+        # the clock as a move requested at start, or None to search instead
+        # (the solver's time is then charged with the rest of the request).
+        # The solver gets at most half the move's budget, so the search
+        # still has time if it fails and an overshoot stays well inside
+        # the hard limit
+        if not self.solver.worth_trying(self.board):
+            return None
+        budget = min(self.solve_time, 0.5 * self.clock.budget(self.board))
+        result = self.solver.solve(self.board, budget)
+        if result is None:
+            return None
+        value, move = result
+        if value == LOSS:
+            print("Solver expects a loss, searching for a swindle")
+            return None
+        if value == WIN:
+            print("You're toast!")
+        print(describe(self.clock.charge(start, budget, 'solved')))
+        print("Solved! Choosing move {} with value {}".format(move, value))
+        return move
+
+    def ponder(self):
+        # Keep searching in the background (on the opponent's time too)
+        # until stop_pondering, starting the thread if needed
+        with self._ponder:
+            if self._stopped:
+                return
+            self._pondering = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._ponder_loop)
+                self._thread.daemon = True
+                self._thread.start()
+            self._ponder.notify_all()
+
+    def stop_pondering(self):
+        # Pause the background search, returning once no search is running
+        # (so the caller has the tree to itself) and whether it was pondering
+        with self._ponder:
+            pondering = self._pondering
+            self._pondering = False
+            while self._searching:
+                self._ponder.wait()
+            self._raise_error()
+        return pondering
+
+    def end_pondering(self):
+        # Stop the background search for good (eg. in stop), returning once
+        # the pondering thread has nothing left to do and will exit
+        with self._ponder:
+            self._stopped = True
+            self._pondering = False
+            self._ponder.notify_all()
+            while self._searching:
+                self._ponder.wait()
+
+    def stopping(self):
+        # Whether the search step running in the pondering thread should
+        # give up, because stop_pondering is waiting for it (a step that
+        # overruns step_time would otherwise hold up the move)
+        return self._searching and not self._pondering
+
+    def think(self, deadline, done=None, enough=None, latest=None):
+        # Search until the deadline (a time()), or until done() is true.
+        # If enough() is given, keep searching past the deadline until it
+        # is true, but no later than latest (a time(), eg. Clock.latest)
+        # when given. Stops one step_time early, so the step still running
+        # ends by the deadline. Returns what stopped it: 'done', 'deadline'
+        # or 'interrupted' (see interrupt)
+        done = done or (lambda: False)
+        enough = enough or (lambda: True)
+        overdue = lambda: latest is not None and time() >= latest - self.step_time
+        self.ponder()
+        with self._ponder:
+            while not (done() or (time() >= deadline - self.step_time and (enough() or overdue()))):
+                if self.board.winner is not None or self._interrupted or self._error is not None:
+                    break
+                # Wake for the deadline, then for latest (a long search
+                # step may not end before it)
+                stop = deadline - self.step_time
+                if time() < stop:
+                    self._ponder.wait(stop - time())
+                elif latest is not None:
+                    self._ponder.wait(max(0, latest - self.step_time - time()))
+                else:
+                    self._ponder.wait()
+            self._raise_error()
+            if self._interrupted:
+                return 'interrupted'
+        return 'done' if done() else 'deadline'
+
+    def interrupt(self, thread):
+        # Cut short the request running on the thread (its think returns
+        # at once) and wait for it to return, so nothing else uses the
+        # tree until it has
+        with self._ponder:
+            self._interrupted = True
+            self._ponder.notify_all()
+        thread.join()
+        with self._ponder:
+            self._interrupted = False
+
+    def _ponder_loop(self):
+        # The pondering thread: one search at a time, outside the condition,
+        # waking stop_pondering and think after each
+        while True:
+            with self._ponder:
+                self._searching = False
+                self._ponder.notify_all()
+                while not self._pondering or self.board.winner is not None or self._stopped:
+                    if self.board.winner is not None or self._stopped:
+                        # The game is over
+                        self._thread = None
+                        return
+                    self._ponder.wait()
+                self._searching = True
+            start = time()
+            try:
+                self.search()
+            except Exception as e:
+                # Hand the error to the bot's thread instead of leaving it
+                # waiting on a search that will never finish
+                with self._ponder:
+                    self._error = e
+                    self._pondering = False
+                    self._searching = False
+                    self._thread = None
+                    self._ponder.notify_all()
+                raise
+            self.step_time = max(time() - start, 0.9 * self.step_time)
+
+    def _raise_error(self):
+        # Raise what killed the pondering thread, once (with the condition held)
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
     def update(self, last_player, last_move):
+        # The search is paused while the move is made,
+        # so the board and tree change together
+        pondering = self.stop_pondering()
         self.board.move(*last_move)
         self.on_update(last_player, last_move)
+        if pondering:
+            self.ponder()
@@ -0,0 +1,38 @@
+from bots.base_bot import BaseBot
+import bots
+from opening_book import OpeningBook
+
+class Bot(BaseBot):
+    """
+    Plays from an opening book while the position is in it,
+    then hands control to another bot.
+
+    Arguments: <book file> <bot name> [bot args*]
+    """
+    def setup(self, *args):
+        self.book = OpeningBook.load(args[0])
+        self.bot = bots.get_bot(args[1])(self.board.clone(), self.player, *args[2:])
+        print("Loaded {} book positions".format(len(self.book)))
+
+    def start(self):
+        self.bot.start()
+
+    def stop(self):
+        self.bot.stop()
+
+    def metrics(self):
+        return self.bot.metrics()
+
+    def sync_clock(self, remaining, move_limit):
+        self.bot.sync_clock(remaining, move_limit)
+
+    def update(self, last_player, last_move):
+        super(Bot, self).update(last_player, last_move)
+        self.bot.update(last_player, last_move)
+
+    def request(self):
+        move = self.book.lookup(self.board)
+        if move is not None:
+            print("Book move {}".format(move))
+            return move
+        return self.bot.request()
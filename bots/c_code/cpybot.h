@@ -29,7 +29,8 @@ void setup(int argc, char** argv);
 void start(void);
 void stop(void);
 void update(int last_player, move_t last_move);
-move_t request(void);
+// seconds is how long the move may take (see bots/cpybot.py)
+move_t request(double seconds);
 
 // The methods below adapt the python client to the C code.
 static PyObject* _pybot_setup(PyObject* self, PyObject* args);
@@ -102,7 +103,12 @@ static PyObject* _pybot_update(PyObject* self, PyObject* args){
 }
 
 static PyObject* _pybot_request(PyObject* self, PyObject* args){
-    move_t move = request();
+    double seconds;
+
+    if (!PyArg_ParseTuple(args, "d", &seconds)) {
+        return NULL;
+    }
+    move_t move = request(seconds);
 
     return Py_BuildValue("(ii)", move.row, move.col);
 }
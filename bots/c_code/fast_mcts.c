@@ -16,12 +16,10 @@
 // increase this number significantly, consider disabling
 // pruning.
 // Expect about 10,000,000 per GB
-// TIMEOUT prevents the bot from spending too long thinking
-//  (does not count pruning time)
-// MIN_SEARCHES ensures the bot considered enough options
+// MIN_SEARCHES is enough searches to move before the deadline
+// (request() is given the seconds it may take by cpybot's clock)
 #define MIN_SEARCHES 1048576
 #define MAX_STATES 16777216
-#define TIMEOUT 20
 
 // Coefficients for different calculations of UCT
 // UCB_CONST and LCB_CONST are used for printing statistics
@@ -32,6 +30,17 @@
 #define PICK_CONST -0.1
 #define SELECT_CONST 1.414
 
+// ** RAVE (Selection) **
+// All-moves-as-first statistics: a child also counts every playout
+// through its parent in which its move was played later by the same
+// player. Selection blends them into the mean with weight
+// beta = sqrt(RAVE_K / (3*visits + RAVE_K)), which is about 1/2 after
+// RAVE_K visits, so the many (biased) AMAF samples guide the search
+// until a node has enough playouts of its own.
+// Off unless setup is given "rave" (eg. cpy fast rave).
+static int use_rave = 0;
+#define RAVE_K 1000
+
 // ** Simulation **
 // Using a random roll simulation is fast enough for many
 // evaluations, but some heuristics can greatly improve the
@@ -85,7 +94,9 @@
 #include "fast_mcts.h"
 
 #include <stdlib.h>
+#include <string.h>
 #include <time.h>
+#include <errno.h>
 #include <pthread.h>
 
 #include <math.h>
@@ -100,19 +111,83 @@ int searches = 0;
 int num_sims = 0;
 int num_states = 0;
 
-int count_children(tree_node_t* node) {
-    if (node == NULL) return 0;
+// Signalled by the workers when they finish their searches
+static pthread_mutex_t think_lock = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t think_cond = PTHREAD_COND_INITIALIZER;
+
+// ** Telemetry **
+// metrics() returns the search metrics of the last request, which
+// cpybot adds to the move's telemetry record (see bots/telemetry.py).
+// Phases are only timed when UTTT_TELEMETRY is set.
+static int timing = 0;
+
+typedef struct {
+    int searches;
+    int sims;
+    double elapsed;
+    double select, expand, simulate, backprop;
+    long depth_sum;
+    int depth_max;
+    int pruned;
+    int states;
+} search_stats_t;
+
+// Stats of the search running now, and of the last one stopped.
+// Each worker counts its own and adds them in when it stops.
+static pthread_mutex_t stats_lock = PTHREAD_MUTEX_INITIALIZER;
+static search_stats_t stats;
+static search_stats_t last_stats;
+static double search_start;
+
+static void add_stats(search_stats_t* total, const search_stats_t* part) {
+    pthread_mutex_lock(&stats_lock);
+    total->select += part->select;
+    total->expand += part->expand;
+    total->simulate += part->simulate;
+    total->backprop += part->backprop;
+    total->depth_sum += part->depth_sum;
+    if (part->depth_max > total->depth_max) total->depth_max = part->depth_max;
+    total->pruned += part->pruned;
+    pthread_mutex_unlock(&stats_lock);
+}
 
-    int count = 1;
-    for (int i = 0; i < node->num_children; i++) {
-        count += count_children(node->children[i]);
-    }
-    return count;
+static double now(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + t.tv_nsec / 1e9;
+}
+
+#ifndef LOCAL_BUILD
+static PyObject* _fast_mcts_metrics(PyObject* self, PyObject* args) {
+    search_stats_t* s = &last_stats;
+    return Py_BuildValue("{s:i,s:i,s:d,s:d,s:i,s:k,s:i,s:d,s:d,s:d,s:d,s:d,s:i}",
+            "searches", s->searches,
+            "playouts", s->sims,
+            "playouts_per_sec", s->sims / (s->elapsed > 0 ? s->elapsed : 1e-9),
+            "search_time", s->elapsed,
+            "tree_nodes", s->states,
+            "tree_bytes", (unsigned long)s->states * (sizeof(tree_node_t) + sizeof(tree_node_t*)),
+            "depth_max", s->depth_max,
+            "depth_avg", (double)s->depth_sum / (s->searches > 0 ? s->searches : 1),
+            "select", s->select,
+            "expand", s->expand,
+            "simulate", s->simulate,
+            "backprop", s->backprop,
+            "pruned", s->pruned);
 }
+#endif
 
 void setup(int argc, char** argv) {
     srand(time(NULL));
 
+    const char* path = getenv("UTTT_TELEMETRY");
+    timing = path != NULL && *path;
+
+    for (int i = 0; i < argc; i++) {
+        if (strcmp(argv[i], "rave") == 0)
+            use_rave = 1;
+    }
+
 	uttt_init(&board);
     
     tree = malloc(sizeof(tree_node_t));
@@ -124,6 +199,8 @@ void setup(int argc, char** argv) {
     tree->children = NULL;
     tree->num_children = -1;
     tree->visits = 0;
+    tree->amaf_mean = 0.0f;
+    tree->amaf_visits = 0;
     tree->parent = NULL;
 
 	srand(time(NULL));
@@ -140,8 +217,7 @@ void update(int last_player, move_t last_move) {
     int old_states = num_states;
     int cut = 0;
 
-    int tree_size = count_children(tree);
-    printf("tree size = %d, num_states = %d\n", tree_size, num_states);
+    printf("num_states = %d\n", num_states);
 
     if (board.player != last_player)
         printf("ERROR: Did not simulate the right board\n");
@@ -166,6 +242,8 @@ void update(int last_player, move_t last_move) {
         node->children = NULL;
         node->num_children = -1;
         node->visits = 0;
+        node->amaf_mean = 0.0f;
+        node->amaf_visits = 0;
         node->parent = NULL;
 
         cut = cut_branch(tree);
@@ -202,19 +280,38 @@ void update(int last_player, move_t last_move) {
 
     start_threads();
 }
-move_t request() { 
-    int timeout = 0;
+// The time seconds after t
+static struct timespec after(struct timespec t, double seconds) {
+    long nsec = t.tv_nsec + (long)((seconds - (long)seconds) * 1e9);
+    t.tv_sec += (time_t)seconds + nsec / 1000000000;
+    t.tv_nsec = nsec % 1000000000;
+    return t;
+}
+
+move_t request(double seconds) {
+    struct timespec start, deadline, current;
+    int rc = 0;
     printf("Thinking...\r");
     fflush(stdout);
-    while (tree->num_children <= 0 || 
-            (timeout++ < TIMEOUT && searches < MIN_SEARCHES)) {
-        sleep(1);
-    }
-    if (timeout >= TIMEOUT) {
-        printf("Timed out.\n");
-    } else {
-        printf("OK.\n");
+
+    // Wait for the workers to finish their searches, or the deadline
+    clock_gettime(CLOCK_REALTIME, &start);
+    deadline = after(start, seconds > 0 ? seconds : 0);
+    pthread_mutex_lock(&think_lock);
+    while (tree->num_children <= 0 ||
+            (rc != ETIMEDOUT && searches < MIN_SEARCHES)) {
+        rc = pthread_cond_timedwait(&think_cond, &think_lock, &deadline);
+        // Never move without a tree, however long it takes
+        if (rc == ETIMEDOUT && tree->num_children <= 0) {
+            clock_gettime(CLOCK_REALTIME, &deadline);
+            deadline = after(deadline, 0.01);
+        }
     }
+    pthread_mutex_unlock(&think_lock);
+
+    clock_gettime(CLOCK_REALTIME, &current);
+    printf("%s after %.2fs (%d searches)\n", rc == ETIMEDOUT ? "Timed out" : "OK",
+            (current.tv_sec - start.tv_sec) + (current.tv_nsec - start.tv_nsec) / 1e9, searches);
     stop_threads();
 
     printf("Getting best...\n");
@@ -251,6 +348,9 @@ void* worker( void* argument ) {
     int prune_timer = PRUNE_TIMER;
 
     int ready = 0;
+    double t0 = 0, t1 = 0, t2 = 0, t3 = 0;
+    search_stats_t local;
+    memset(&local, 0, sizeof(local));
 
     while (working && !ready) {
         ready = (++searches % MIN_SEARCHES == 0) || ready;
@@ -259,9 +359,11 @@ void* worker( void* argument ) {
         // MCTS with pruning
         
         // ** Selection **
+        if (timing) t0 = now();
         selection(&board_copy, tree, &leaf);
 
         // ** Expansion **
+        if (timing) t1 = now();
         int player = board_copy.player;
         if (num_states < MAX_STATES)
             expand(&board_copy, leaf, &node);
@@ -269,6 +371,12 @@ void* worker( void* argument ) {
             node = leaf;
         
         // ** Simulation **
+        if (timing) {
+            t2 = now();
+            int depth = board.turns_left - board_copy.turns_left;
+            local.depth_sum += depth;
+            if (depth > local.depth_max) local.depth_max = depth;
+        }
         if (searches < RAPID_SEARCHES) { 
             winner = rapid_simulate(&board_copy);
             num_sims++;
@@ -278,7 +386,23 @@ void* worker( void* argument ) {
         }
         
         // ** Backprop **
+        if (timing) t3 = now();
         backprop(player, winner, node);
+        if (use_rave)
+            backprop_amaf(&board_copy, winner, node);
+        if (timing) {
+            local.select += t1 - t0;
+            local.expand += t2 - t1;
+            local.simulate += t3 - t2;
+            local.backprop += now() - t3;
+        }
+
+        // Wake request() once the tree has a root
+        if (searches == 1) {
+            pthread_mutex_lock(&think_lock);
+            pthread_cond_broadcast(&think_cond);
+            pthread_mutex_unlock(&think_lock);
+        }
         
         // ** Pruning **
         if (can_prune && searches % prune_timer == 0 &&
@@ -314,6 +438,7 @@ void* worker( void* argument ) {
                 total_pruned += pruned;
             }
 
+            local.pruned += total_pruned;
             if (total_pruned == 0) {
                 prune_timer <<= 1;
                 printf("Prune ineffective. Waiting %d searches\n", prune_timer);
@@ -323,6 +448,13 @@ void* worker( void* argument ) {
             }
         }
     }
+
+    add_stats(&stats, &local);
+
+    // Done searching, so request() can stop waiting
+    pthread_mutex_lock(&think_lock);
+    pthread_cond_broadcast(&think_cond);
+    pthread_mutex_unlock(&think_lock);
     return NULL;
 }
 
@@ -358,10 +490,37 @@ tree_node_t* select_best(tree_node_t* parent, const float coeff) {
     return parent->children[best];
 }
 
+tree_node_t* select_rave(tree_node_t* parent, const float coeff) {
+    tree_node_t* child;
+    int best = 0;
+    float best_score = -INFINITY;
+    float score, beta, mean;
+    for (int i = 0; i < parent->num_children; i++) {
+        child = parent->children[i];
+        if (parent->visits == 0 || (child->visits == 0 && child->amaf_visits == 0)) {
+            score = INFINITY;
+        } else {
+            beta = child->amaf_visits > 0 ?
+                sqrtf(RAVE_K / (3.0f*child->visits + RAVE_K)) : 0.0f;
+            mean = (1.0f - beta)*child->mean + beta*child->amaf_mean;
+            score = mean + coeff*sqrtf(logf((float)parent->visits) /
+                    (float)(child->visits > 0 ? child->visits : 1));
+        }
+        if (score > best_score) {
+            best_score = score;
+            best = i;
+        }
+    }
+    return parent->children[best];
+}
+
 void selection(board_t* game, tree_node_t* tree, tree_node_t** node) {
     *node = tree;
     while ((*node)->num_children > 0) {
-        *node = select_best(*node, SELECT_CONST);
+        if (use_rave)
+            *node = select_rave(*node, SELECT_CONST);
+        else
+            *node = select_best(*node, SELECT_CONST);
         uttt_move(game, (*node)->row, (*node)->col);
     }
 }
@@ -387,6 +546,8 @@ int expand(board_t* game, tree_node_t* leaf, tree_node_t** node) {
             child->children = NULL;
             child->mean = 0.0f;
             child->visits = 0;
+            child->amaf_mean = 0.0f;
+            child->amaf_visits = 0;
             child->parent = leaf;
             child->row = row;
             child->col = col;
@@ -460,8 +621,28 @@ void backprop(int player, int winner, tree_node_t* node) {
     }
 }
 
+// Update the AMAF statistics of the children of every node from
+// the leaf up, using the final board of the playout
+void backprop_amaf(board_t* game, int winner, tree_node_t* node) {
+    while (node != NULL) {
+        for (int i = 0; i < node->num_children; i++) {
+            tree_node_t* child = node->children[i];
+            if (game->board[child->row][child->col] != child->player)
+                continue;
+            int amtP = winner == 0 ? 0 : (winner == child->player ? 1 : -1);
+            child->amaf_visits++;
+            child->amaf_mean += (amtP - child->amaf_mean) / child->amaf_visits;
+        }
+        node = node->parent;
+    }
+}
+
 void start_threads(void) {
     printf("Starting threads...");
+    pthread_mutex_lock(&stats_lock);
+    memset(&stats, 0, sizeof(stats));
+    pthread_mutex_unlock(&stats_lock);
+    search_start = now();
     working = 1;
     for (int i=0; i < num_threads; i++) {
         fflush(stdout);
@@ -482,6 +663,13 @@ void stop_threads(void) {
     printf("    Searches run: %d\n", searches);
     printf("    Simulations run: %d\n", num_sims);
     printf("    Total States: %d\n", num_states);
+    pthread_mutex_lock(&stats_lock);
+    last_stats = stats;
+    pthread_mutex_unlock(&stats_lock);
+    last_stats.searches = searches;
+    last_stats.sims = num_sims;
+    last_stats.elapsed = now() - search_start;
+    last_stats.states = num_states;
     searches = 0;
     num_sims = 0;
 }
@@ -23,6 +23,10 @@ typedef struct tree_node_t {
     float mean;
     int visits;
 
+    // All-moves-as-first statistics (RAVE)
+    float amaf_mean;
+    int amaf_visits;
+
     struct tree_node_t* parent;
 
     int num_children;
@@ -37,12 +41,14 @@ void stop_threads(void);
 
 tree_node_t* find_node(tree_node_t* node, int row, int col);
 tree_node_t* select_best(tree_node_t* node, float coeff);
+tree_node_t* select_rave(tree_node_t* node, float coeff);
 
 void selection(board_t* board, tree_node_t* tree, tree_node_t** leaf);
 int expand(board_t* board, tree_node_t* leaf, tree_node_t** node);
 int rapid_simulate(board_t* board);
 int simulate(board_t* board);
 void backprop(int player, int winner, tree_node_t* leaf);
+void backprop_amaf(board_t* board, int winner, tree_node_t* leaf);
 int prune(tree_node_t* branch, board_t* game);
 int remove_low_conf(tree_node_t* branch);
 int cut_branch(tree_node_t* branch);
@@ -52,12 +58,15 @@ void show_choices(tree_node_t* branch);
 
 #ifndef LOCAL_BUILD
 // Parts needed to integrate with python host.
+static PyObject* _fast_mcts_metrics(PyObject* self, PyObject* args);
+
 static PyMethodDef Cpybot_Methods[] = {
 	{"setup", _pybot_setup, METH_VARARGS, "Setup the bot"},
 	{"start", _pybot_start, METH_VARARGS, "Start the bot thread"},
 	{"stop", _pybot_stop, METH_VARARGS, "Stop the bot thread"},
 	{"update", _pybot_update, METH_VARARGS, "Send an update of the game state"},
 	{"request", _pybot_request, METH_VARARGS, "Request a move from the bot"},
+	{"metrics", _fast_mcts_metrics, METH_VARARGS, "Search metrics of the last request"},
 	{NULL, NULL, 0, NULL}	// Sentinel
 };
 
@@ -0,0 +1,160 @@
+"""
+Time management for the bots.
+
+A Clock hands out per-move time budgets and deadlines, and keeps a
+report of how each move's time was spent. Bots that search in a thread
+wait on it with BaseBot.think and then charge the clock; bots that
+search elsewhere can just wait for the deadline.
+
+Without a game clock, a move may use move_time seconds from the last
+update (so time spent thinking on the opponent's turn counts). With a
+game clock, each budget is a share of the time remaining, based on how
+many moves are likely left, and only time spent in request() is
+charged to the clock.
+"""
+from collections import namedtuple
+from time import time, sleep
+
+# How a move's budget was spent
+Report = namedtuple('Report', ['budget', 'used', 'pondered', 'reason', 'remaining'])
+
+class Clock:
+    def __init__(self, move_time=15, game_time=None, min_moves_left=8, reserve=0.5, min_reserve=0.1):
+        self.move_time = move_time
+        self.remaining = game_time
+        # The whole game clock (the most we have seen on it)
+        self.game_time = game_time
+        # Assume the game lasts at least this many more of our moves
+        self.min_moves_left = min_moves_left
+        # Seconds of a limit never handed out (network, overhead),
+        # at most a tenth of the limit but at least min_reserve (see held_back)
+        self.reserve = reserve
+        self.min_reserve = min_reserve
+
+        # Seconds the host allows for the move (None for no limit),
+        # and when its time controls for the move arrived
+        self.limit = None
+        self.synced = None
+
+        self.reports = []
+        self.last_update = time()
+
+    def update(self):
+        """ Called when a move is made; thinking starts again from here """
+        self.last_update = time()
+
+    def sync(self, remaining, limit=None):
+        """
+        Set the time left on the game clock and the limit for the move,
+        as sent by the host (None leaves our own game clock alone)
+        """
+        if remaining is not None:
+            self.remaining = remaining
+            self.game_time = max(self.game_time or 0, remaining)
+        self.limit = limit
+        self.synced = time()
+
+    def started(self):
+        """
+        When the move being requested started: when the host's time
+        controls for it arrived (so the time spent applying the opponent's
+        move counts), or now without them
+        """
+        if self.synced is None:
+            return time()
+        return self.synced
+
+    def budget(self, board):
+        """ Seconds the next move may use """
+        if self.remaining is None:
+            budget = self.move_time
+        else:
+            # About a third of the cells get played by each side before the
+            # game is decided, so turns_left // 3 is our moves left
+            moves_left = max(self.min_moves_left, board.turns_left // 3)
+            budget = (self.remaining - self.held_back(self.game_time)) / moves_left
+        hard = self.hard_limit()
+        if hard is not None:
+            budget = min(budget, hard)
+        return max(0, budget)
+
+    def deadline(self, budget, start):
+        """ When a move with the budget, requested at start, must be made """
+        if self.remaining is None:
+            deadline = self.last_update + budget
+        else:
+            deadline = start + budget
+        hard = self.hard_limit()
+        if hard is not None:
+            deadline = min(deadline, start + hard)
+        return deadline
+
+    def hard_limit(self):
+        """
+        Seconds a move can take without losing on time: the host's move
+        limit or the game clock, less what is held back (None if neither is set)
+        """
+        limits = []
+        if self.limit is not None:
+            limits.append(self.limit - self.held_back(self.limit))
+        if self.remaining is not None:
+            limits.append(self.remaining - self.held_back(self.game_time))
+        if not limits:
+            return None
+        return max(0, min(limits))
+
+    def held_back(self, limit):
+        """
+        Seconds of a limit (a move limit or the whole game clock) kept in
+        reserve: the reserve, but no more than a tenth of the limit, so
+        short time controls still leave time to think. At least min_reserve
+        (or half of a very short limit) is kept, since a search step or the
+        solver can finish a little after the deadline
+        """
+        limit = max(0, limit)
+        return max(min(self.reserve, 0.1 * limit), min(self.min_reserve, 0.5 * limit))
+
+    def latest(self, start):
+        """
+        When a move requested at start uses up its hard limit, so it must
+        be made whatever else the search wants (None if there is no limit)
+        """
+        hard = self.hard_limit()
+        if hard is None:
+            return None
+        return start + hard
+
+    def wait(self, board, start=None):
+        """
+        Block until the deadline of a move requested at start (now by
+        default) and charge the clock for it, for bots whose search
+        runs elsewhere (eg. in worker processes)
+        """
+        if start is None:
+            start = self.started()
+        budget = self.budget(board)
+        deadline = self.deadline(budget, start)
+        if time() < deadline:
+            sleep(deadline - time())
+        return self.charge(start, budget, 'deadline')
+
+    def charge(self, start, budget, reason):
+        """
+        Record a move requested at start, taking the time used off the
+        game clock, for bots that wait themselves (eg. with BaseBot.think)
+        """
+        now = time()
+        used = now - start
+        self.synced = None
+        if self.remaining is not None:
+            self.remaining -= used
+        report = Report(budget, used, max(0, start - self.last_update), reason, self.remaining)
+        self.reports.append(report)
+        return report
+
+def describe(report):
+    text = "Thought for {:.2f}s of a {:.2f}s budget (+{:.2f}s pondering), stopped by {}".format(
+        report.used, report.budget, report.pondered, report.reason)
+    if report.remaining is not None:
+        text += ", {:.1f}s left on the clock".format(report.remaining)
+    return text
@@ -1,4 +1,6 @@
+from time import time
 from bots.base_bot import BaseBot
+from bots.clock import Clock, describe
 
 class Bot(BaseBot):
     """
@@ -12,8 +14,14 @@ class Bot(BaseBot):
         self.cbot = get_cbot(args[0])
         self.cbot.setup(*args[1:])
 
+        # The host's time controls reach the clock through sync_clock,
+        # and request tells the C code how long it may think
+        self.thinking_time = 20
+        self.clock = Clock(self.thinking_time)
+
     def start(self):
         """ Called after the connection is made """
+        self.clock.update()
         self.cbot.start()
 
     def stop(self):
@@ -24,6 +32,13 @@ class Bot(BaseBot):
         """ Called after a move is made """
         import fast_mcts
         self.cbot.update(last_player, last_move)
+        self.clock.update()
+
+    def metrics(self):
+        """ Search metrics of the last request, for bots that report them """
+        if hasattr(self.cbot, 'metrics'):
+            return self.cbot.metrics()
+        return {}
 
     def update_board(self, board):
         """ Called on a board wipe signal (NOT IMPLEMENTED) """
@@ -31,7 +46,11 @@ class Bot(BaseBot):
 
     def request(self):
         """ Called when the bot is expected to make a turn """
-        return self.cbot.request()
+        start = self.clock.started()
+        budget = self.clock.budget(self.board)
+        move = self.cbot.request(max(0, self.clock.deadline(budget, start) - time()))
+        print(describe(self.clock.charge(start, budget, 'deadline')))
+        return move
 
 def get_cbot(name):
     if name == 'mcts':
@@ -1,6 +1,7 @@
 from bots.base_bot import BaseBot
 import bots
-from time import sleep
+from time import time
+import threading
 
 class Bot(BaseBot):
     def setup(self, *args):
@@ -9,6 +10,9 @@ class Bot(BaseBot):
 
         self.interrupted = False
 
+        # Seconds the human always gets to interrupt
+        self.window = 3
+
     def start(self):
         self.bot.start()
         self.human.start()
@@ -17,6 +21,12 @@ class Bot(BaseBot):
         self.bot.stop()
         self.human.stop()
 
+    def metrics(self):
+        return self.bot.metrics()
+
+    def sync_clock(self, remaining, move_limit):
+        self.bot.sync_clock(remaining, move_limit)
+
     def update(self, last_player, last_move):
         super(Bot, self).update(last_player, last_move)
         self.bot.update(last_player, last_move)
@@ -26,10 +36,8 @@ class Bot(BaseBot):
         while True:
             if not self.interrupted:
                 try:
-                    print("Press Ctrl+C to interrupt in the next 3 seconds...")
-                    sleep(3)
-                    print("Letting bot take control.")
-                    return self.bot.request()
+                    print("Press Ctrl+C to interrupt in the next {} seconds...".format(self.window))
+                    return self.bot_request()
                 except KeyboardInterrupt:
                     print("\nGiving control to human.")
                     self.interrupted = True
@@ -38,3 +46,28 @@ class Bot(BaseBot):
             except KeyboardInterrupt:
                 self.interrupted = False
                 print("\nRestoring control to bot...")
+
+    def bot_request(self):
+        # The bot thinks while the human decides whether to interrupt,
+        # so the window overlaps its thinking time instead of adding to it
+        result = []
+        finished = threading.Event()
+        def ask():
+            result.append(self.bot.request())
+            finished.set()
+        thread = threading.Thread(target=ask)
+        thread.daemon = True
+        thread.start()
+
+        window_end = time() + self.window
+        try:
+            finished.wait()
+            # Give the human the rest of the window if the bot was quick
+            if time() < window_end:
+                threading.Event().wait(window_end - time())
+        except KeyboardInterrupt:
+            # Stop the bot's request before the human takes over,
+            # so it is not searching while the tree is re-rooted
+            self.bot.interrupt(thread)
+            raise
+        return result[0]
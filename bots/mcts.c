@@ -92,7 +92,7 @@ void update(int last_player, move_t last_move) {
 // Called when it's your turn. Just return a move_t tuple.
 // This tuple only contains a row and column in 9x9 grid coordinates
 // as integers.
-move_t request(void) {
+move_t request(double seconds) {
     // move_t move; move.row = 0; move.col = 0; return move;
     move_t move;
     for (size_t i = 0; i < 9; i++) {
@@ -1,21 +1,33 @@
 from bots.base_bot import BaseBot
-from math import sqrt, log
-from time import time, sleep
-from random import choice, shuffle, randint, random
-from queue import PriorityQueue
-import threading
-
-import numpy as np
-import winning_state
+from math import sqrt, log, isinf
+from sys import getsizeof
+from time import perf_counter
+from random import shuffle
+from heapq import heappush, heappop
+
+import simulations
+from batch_playout import tally
+from bots.transposition import TranspositionTable, position_key
+from bots.solver import Solver
+from bots.clock import Clock, describe
+from bots.rave import get_schedule
+from bots.telemetry import SearchStats
+from board import _bit_index
+
+class Abandoned(Exception):
+    pass
 
 class Bot(BaseBot):
     def setup(self, *args):
         """ Called after initialization """
         self.thinking_time = 30
-        self.tree = PriorityQueue()
+        self.tree = Node()
         self.total_sims = 1
-        self.lock = threading.Lock()
-        self.parent_score = (0,1)
+        self.counter = 0
+
+        # Endgame solver and its time budget (seconds)
+        self.solver = Solver()
+        self.solve_time = 5
 
         # arg0 = simulation
         if len(args) > 0:
@@ -52,254 +64,357 @@ class Bot(BaseBot):
             self.max_evaluations = int(args[4])
         print("Using at most {} move evaluations".format(self.max_evaluations))
 
+        # arg5 = transposition table size (0 to disable)
+        self.transpositions = None
+        if len(args) > 5 and int(args[5]) > 0:
+            self.transpositions = TranspositionTable(int(args[5]))
+            print("Sharing statistics across up to {} transpositions".format(self.transpositions.max_size))
+
+        # arg6 = symmetry depth (plies in which symmetric positions share statistics)
+        self.symmetry_depth = 0
+        if len(args) > 6:
+            self.symmetry_depth = int(args[6])
+            if self.symmetry_depth > 0 and self.transpositions is None:
+                self.transpositions = TranspositionTable()
+            print("Merging symmetric positions in the first {} plies".format(self.symmetry_depth))
+
+        # arg7 = game clock in seconds (0 to use the thinking time for every move)
+        game_time = None
+        if len(args) > 7 and float(args[7]) > 0:
+            game_time = float(args[7])
+            print("Budgeting {} seconds for the game".format(game_time))
+        self.clock = Clock(self.thinking_time, game_time)
+
+        # arg8 = RAVE schedule, eg. sqrt:1000 or mse:0.1 (0 to disable)
+        # Selection then scans every child, since AMAF updates change
+        # the priorities of siblings that were not played
+        self.schedule = None
+        if len(args) > 8:
+            self.schedule = get_schedule(args[8])
+            if self.schedule is not None:
+                print("Blending in AMAF statistics with schedule '{}'".format(args[8]))
+
+        # Search statistics for telemetry (None when it is off)
+        self.stats = SearchStats() if self.telemetry is not None else None
+
     def start(self):
         """ Called after the connection is made """
-        self.last_request = time()
-        self.choice = None
+        self.clock.update()
         self.counter = 0
 
         print("Getting ready...")
-        self.playing = True
-        self.thread = threading.Thread(target=self.think)
-        self.thread.start()
+        self.ponder()
         print("I'm ready to play!")
 
     def stop(self):
-        self.playing = False
-
-    def think(self):
-        while self.playing:
-            self.lock.acquire()
-            self.search()
-            self.lock.release()
-            sleep(0.0001)
+        self.end_pondering()
 
-    def update(self, last_player, last_move):
+    def on_update(self, last_player, last_move):
         """ Called after a move is made """
-        self.lock.acquire()
-        super(Bot, self).update(last_player, last_move)
-
-        self.parent = self.tree
-
         # Cut the old tree down
-        move = None
-        # If we made a choice recently, it probably matches
-        if self.choice is not None:
-            (_, score, move, subtree) = self.choice
-
-        # Discard root node branches until we find this move
-        while move != last_move:
-            (_, score, move, subtree) = self.tree.get()
-
-        self.tree = subtree
-        self.choice = None
+        self.tree = self.tree.child(last_move)
         self.counter = 0
-        self.lock.release()
-
-    def dfs_check(self, board, max_depth=2, max_nodes=1000, depth=1, num_checked=None):
-        if num_checked is None:
-            num_checked = [0]
-
-        if max_depth == 0:
-            return None
-
-        if num_checked[0] > max_nodes:
-            return None
-
-        # Check current depth
-        to_check = []
-        # -- Shuffle the options in case we get lucky
-        options = board.get_valid()
-        shuffle(options)
-        for move in options:
-            B = board.clone()
-            B.move(*move)
-            if B.winner == self.player:
-                return [move], []
-            if B.winner is None:
-                to_check.append(move)
-            else:
-                # Draw or other player win. This branch is dead
-                return None
-            # Don't over extend
-            num_checked[0] += 1
-            if num_checked[0] > max_nodes:
-                return None
-        # Try the next layer
-        best_conf = float('inf')
-        best_len = float('inf')
-        best_path = None
-        good_options = []
-        for move in to_check:
-            B = board.clone()
-            B.move(*move)
-            search = self.dfs_check(B, max_depth-1, max_nodes, depth+1, num_checked)
-            if search is not None:
-                moves, _ = search
-                path = [move] + moves
-                conf = self._lookup(move)
-                conf = -float('inf') if conf is None else conf
-                good_options.append((len(path), -conf, path))
-                if len(path) <= best_len and conf <= best_conf:
-                    best_path = path
-                    best_len = len(path)
-                    best_conf = conf
-        if best_path:
-            return best_path, sorted(good_options)
-        else:
-            return None
-
-    def _lookup(self, search_move):
-        # Returns the score for a given move in the top-level tree
-        self.lock.acquire()
-        tmp = []
-        result = None
-        while not self.tree.empty():
-            branch = self.tree.get()
-            tmp.append(branch)
-            priority, score, move, subtree = branch
-            if search_move == move:
-                result = priority
-        for b in tmp:
-            self.tree.put(b)
-        self.lock.release()
-        return result
+        self.clock.update()
+        # Telemetry for our next move covers the search from our last one
+        if self.stats is not None and last_player == self.player:
+            self.stats.reset()
 
     def request(self):
         print("My turn?")
-        think_time = self.last_request + (time()-self.last_request)/2
-
-        # If there's a one move win, take it
-        # (turn 18 is the first turn in which a player can win)
-        if self.board.turns_left < 64:
-            board = self.board.clone()
-            dfs = self.dfs_check(board, max_depth=8)
-            if dfs is not None:
-                path, options = dfs
-                conf = None
-                if options:
-                    length, conf, path = options[0]
-                move = path[0]
-                if len(path) == 1:
-                    print("You're toast!")
-                else:
-                    print("This seems good...")
-                sleep(2)
-
-                if conf:
-                    print("Choosing move {} with confidence {:.3f}".format(move, conf))
-                else:
-                    print("Choosing move {} for the win".format(move))
-                return move
-
-        # Think using MCTS
-        def needs_to_think():
-            return (self.counter < self.min_evaluations \
-                   or time() - think_time < self.thinking_time) \
-                   and self.counter < self.max_evaluations
-
-        # Make sure we thought for long enough
-        if needs_to_think():
-            while needs_to_think():
-                print("Hmm", '.'*int(time()%3 + 1), end='    \r', flush=True)
-                sleep(.5)
-            print("Okay, I got it.")
-        else:
-            print("Okay")
+        start = self.clock.started()
+
+        # Solve the endgame exactly once the tree is small enough.
+        # Take a proven win or draw, and leave a proven loss to MCTS
+        # in case the opponent slips.
+        move = self.solved_move(start)
+        if move is not None:
+            return move
+
+        # Think using MCTS until the deadline, making sure we thought for long enough
+        print("Hmm...", end='    \r', flush=True)
+        budget = self.clock.budget(self.board)
+        reason = self.think(self.clock.deadline(budget, start),
+                            done=lambda: self.counter >= self.max_evaluations,
+                            enough=lambda: self.counter >= self.min_evaluations,
+                            latest=self.clock.latest(start))
+        # (charging the clock once the last evaluation is done)
+        pondering = self.stop_pondering()
+        report = self.clock.charge(start, budget, reason)
+        print("Okay, I got it.")
+        print(describe(report))
 
         # Pick the move that's most likely to win
-        self.lock.acquire()
-        self.parent_score = self._refresh(self.tree)
-
-        self.choice = self.tree.get()
-        self.tree.put(self.choice)
-
-        self.lock.release()
-
-        (priority, score, move, subtree) = self.choice
+        tree = self.tree
+        if not tree.moves:
+            # Out of time before the root was ever expanded
+            move = self.board.random_valid()
+            print("No evaluations finished, choosing move {} at random".format(move))
+            if pondering:
+                self.ponder()
+            return move
+        i = tree.best(self.scoring_func)
+        priority, score, move = self.scoring_func(tree.total, tree.scores[i]), tree.scores[i], tree.moves[i]
+        if pondering:
+            self.ponder()
 
         print("Choosing move {} with confidence {:.3f} <-- {}".format(move, abs(priority), score))
         print("Evaluated {} moves since last request".format(self.counter))
 
-        # Update the internal state
-        self.last_request = time()
-
         return move
 
-    def _refresh(self, tree, tmp_score=None):
-        # Refreshes the priority queue
-        if tmp_score is None:
-            tmp_score = self.scoring_func
-        tmp = []
-        parent_score = [0,0]
-        while not tree.empty():
-            branch = tree.get()
-            tmp.append(branch)
-            parent_score[0] += branch[1][0]
-            parent_score[1] += branch[1][1]
-        for (priority, score, move, subtree) in tmp:
-            priority = tmp_score(parent_score, score)
-            tree.put((priority, score, move, subtree))
-        return tuple(parent_score)
+    def root_stats(self):
+        # {move: (wins, visits)} for the root's branches
+        tree = self.tree
+        return {move: (int(score[0]), int(score[1])) for move, score in zip(tree.moves, tree.scores)}
 
     def scoring_func(self, parent_score, score):
         return -self.get_priority(parent_score, score)
 
-    def score_branch(self, branch):
-        return self.scoring_func(self.parent_score, branch[1])
-
     def search(self):
         board = self.board.clone()
-        self._search(board, self.tree)
+        try:
+            self._search(board, self.tree)
+        except Abandoned:
+            return
         self.counter += 1
 
-    def _search(self, board, tree, parent_score=(0,0)):
+    def _search(self, board, tree):
         player = board.player
-        self._refresh(tree)
+        stats = self.stats
 
-        if not tree.empty():
+        if tree.moves:
             # Selection
-            (_, score, move, subtree) = tree.get()
+            if stats is not None:
+                t = perf_counter()
+            i = self._select(tree)
+            if stats is not None:
+                stats.select += perf_counter() - t
+            move, score = tree.moves[i], tree.scores[i]
             board.move(*move)
-            winner = self._search(board, subtree, score)
+            key = position_key(board, self.symmetry_depth)
+            try:
+                winner = self._search(board, tree.subtree(i))
+            except Abandoned:
+                # Put the selected child back in the heap as it was
+                tree.update(i, score, self._heap_scoring())
+                raise
         else:
             # Expansion
+            if stats is not None:
+                start = perf_counter()
+                simulating = 0.0
             valid = board.get_valid()
             if len(valid) == 0:
                 return board.winner
             shuffle(valid)
+            # (Nothing is added to the node or shared until every branch
+            # is simulated, so a step abandoned part way leaves no trace)
+            children = []
+            shared = {}
             for move in valid[:-1]:
-                # (Simulate all branches at least once)
+                # (Simulate all branches at least once, leaving the node
+                # unexpanded if the search is paused part way through)
+                if self.stopping():
+                    raise Abandoned()
+                if stats is not None:
+                    t = perf_counter()
                 winner = self.simulation(board.clone())
                 self.total_sims += 1
-                win = int(player == winner)
-                score = (win,1)
-                subtree = PriorityQueue()
-                priority = self.scoring_func(parent_score, score)
-                tree.put( (priority, score, move, subtree) )
+                win, games = tally(winner, player)
+                if stats is not None:
+                    simulating += perf_counter() - t
+                    stats.playouts += games
+                board.push(*move)
+                key = position_key(board, self.symmetry_depth)
+                board.pop()
+                if key in shared:
+                    wins, samples = shared[key]
+                else:
+                    wins, samples = self._shared_score(key, (0,0))
+                score = shared[key] = (wins+win, samples+games)
+                children.append((move, score))
+            for key, score in shared.items():
+                self._share_score(key, score)
+            for move, score in children:
+                tree.add(move, score, self._heap_scoring())
 
             move = valid[-1]
             score = (0,0)
-            subtree = PriorityQueue()
+            i = tree.add(move, score)
 
             # Simulation
             board.move(*move)
+            key = position_key(board, self.symmetry_depth)
+            if stats is not None:
+                t = perf_counter()
+                stats.expand += t - start - simulating
+                depth = self.board.turns_left - board.turns_left
             winner = self.simulation(board)
             self.total_sims += 1
+            if stats is not None:
+                stats.simulate += perf_counter() - t + simulating
+                stats.leaf(depth, tally(winner, player)[1])
 
         # Backprop
-        win = int(player == winner)
-        wins, samples = score
+        if stats is not None:
+            t = perf_counter()
+        win, games = tally(winner, player)
+        wins, samples = self._shared_score(key, score)
         wins += win
-        samples += 1
+        samples += games
 
-        parent_score = parent_score[0] + int((3-player) == winner), parent_score[0]+1
         score = (wins, samples)
-        priority = self.scoring_func(parent_score, score)
-        tree.put( (priority, score, move, subtree) )
+        self._share_score(key, score)
+        tree.update(i, score, self._heap_scoring())
+        if self.schedule is not None:
+            # The board now holds the end of the playout (or the leaf,
+            # for simulations that do not play on it)
+            self._update_amaf(tree, board, player, winner)
+        if stats is not None:
+            stats.backprop += perf_counter() - t
 
         return winner
 
+    def metrics(self):
+        # Search metrics for the move (see bots/telemetry.py)
+        # (the tree is walked after the move is sent, with the search paused)
+        pondering = self.stop_pondering()
+        metrics = self.stats.as_dict()
+        nodes = 0
+        nbytes = 0
+        trees = [self.tree]
+        while trees:
+            tree = trees.pop()
+            nodes += len(tree.moves)
+            nbytes += tree.nbytes()
+            trees.extend(subtree for subtree in tree.subtrees if subtree is not None)
+        metrics['tree_nodes'] = nodes
+        metrics['tree_bytes'] = nbytes
+        metrics['root_visits'] = self.tree.total[1]
+        if pondering:
+            self.ponder()
+        return metrics
+
+    def _heap_scoring(self):
+        # Scoring for the children heaps, which RAVE does not use
+        if self.schedule is None:
+            return self.scoring_func
+        return None
+
+    def _select(self, tree):
+        if self.schedule is None:
+            return tree.select(self.scoring_func)
+        return min(range(len(tree.moves)), key=lambda i: self.rave_priority(tree, i))
+
+    def rave_priority(self, tree, i):
+        # Priority with its mean blended with the AMAF mean (lower is
+        # better). The exploration term is added after blending, as in
+        # NodePool.confidence and the C bot
+        priority = self.get_priority(tree.total, tree.scores[i])
+        if isinf(priority):
+            return -priority
+        amaf_wins, amaf_samples = tree.amaf[i]
+        if amaf_samples == 0:
+            return -priority
+        mean = simple_score(tree.total, tree.scores[i])
+        exploration = priority - mean
+        beta = float(self.schedule(tree.scores[i][1], amaf_samples))
+        return -((1 - beta)*mean + beta*(amaf_wins + 1) / (amaf_samples + 2) + exploration)
+
+    def _update_amaf(self, tree, board, player, winner):
+        # Credit the playout to every child whose cell the player took
+        win, games = tally(winner, player)
+        position = board.snapshot()
+        cells = position.cells1 if player == 1 else position.cells2
+        for i, (r, c) in enumerate(tree.moves):
+            if cells >> _bit_index(r, c) & 1:
+                amaf_wins, amaf_samples = tree.amaf[i]
+                tree.amaf[i] = (amaf_wins + win, amaf_samples + games)
+
+    def _shared_score(self, key, score):
+        # Latest statistics of the position, which may have been
+        # updated through a transposition since this node last saw them
+        if self.transpositions is None:
+            return score
+        return self.transpositions.get(key, score)
+
+    def _share_score(self, key, score):
+        if self.transpositions is not None:
+            self.transpositions.put(key, score)
+
+class Node:
+    """
+    The children of a tree node, side by side: moves, scores (wins, samples),
+    AMAF scores (for RAVE) and subtrees (created when first searched), with
+    total the sum of the children's scores.
+
+    Selection pops the best child from a heap of (priority, child) entries.
+    Priorities are only recomputed when popped, which is exact as long as
+    a child's priority can only get worse while other children are played
+    (true for the priority functions below). The selected child stays out
+    of the heap until update() puts it back with its new score.
+    """
+    __slots__ = ('moves', 'scores', 'amaf', 'subtrees', 'total', 'heap')
+
+    def __init__(self):
+        self.moves = []
+        self.scores = []
+        self.amaf = []
+        self.subtrees = []
+        self.total = (0,0)
+        self.heap = []
+
+    def add(self, move, score, scoring_func=None):
+        # Add a child, leaving it out of the heap if there is no scoring_func
+        i = len(self.moves)
+        self.moves.append(move)
+        self.scores.append(score)
+        self.amaf.append((0,0))
+        self.subtrees.append(None)
+        self.total = (self.total[0] + score[0], self.total[1] + score[1])
+        if scoring_func is not None:
+            heappush(self.heap, (scoring_func(self.total, score), i))
+        return i
+
+    def update(self, i, score, scoring_func=None):
+        # Set the score of a selected child and put it back in the heap
+        # (if there is a scoring_func)
+        old = self.scores[i]
+        self.scores[i] = score
+        self.total = (self.total[0] + score[0] - old[0], self.total[1] + score[1] - old[1])
+        if scoring_func is not None:
+            heappush(self.heap, (scoring_func(self.total, score), i))
+
+    def select(self, scoring_func):
+        # Pop the child with the lowest up to date priority
+        while True:
+            _, i = heappop(self.heap)
+            priority = scoring_func(self.total, self.scores[i])
+            if not self.heap or priority <= self.heap[0][0]:
+                return i
+            heappush(self.heap, (priority, i))
+
+    def best(self, scoring_func):
+        # The child with the lowest priority, leaving the heap alone
+        return min(range(len(self.moves)), key=lambda i: scoring_func(self.total, self.scores[i]))
+
+    def nbytes(self):
+        # Bytes held by this node, its lists and their tuples (not the subtrees)
+        tuples = (self.moves, self.scores, self.amaf, self.heap)
+        return (getsizeof(self) + getsizeof(self.total) + getsizeof(self.subtrees)
+                + sum(getsizeof(items) + sum(getsizeof(item) for item in items) for items in tuples))
+
+    def subtree(self, i):
+        if self.subtrees[i] is None:
+            self.subtrees[i] = Node()
+        return self.subtrees[i]
+
+    def child(self, move):
+        # The subtree for the move (a new one if it was never searched)
+        if move in self.moves:
+            return self.subtree(self.moves.index(move))
+        return Node()
+
 def _ucb1(mean, num_plays, total_plays):
     return mean + sqrt(2*log(total_plays) / num_plays)
 
@@ -325,41 +440,13 @@ def ucb(parent_score, score):
 
     return mean + sqrt(log(played) / total_played)
 
-# Simulators
+# Simulators (see the policies in simulations.py)
 
 def get_simulator(id):
-    return {
-        'random': sim1,
-        'miniwins': sim2,       # Broken?
-        'cells': sim3,
-        'trials': sim4,
-    }.get(id, simulation)
+    try:
+        return simulations.get_policy(id)
+    except ValueError:
+        return simulation
 
 def simulation(board):
-    return sim1(board)
-
-def sim1(board):
-    while board.winner is None:
-        move = choice(board.get_valid())
-        board.move(*move)
-    return board.winner
-
-def sim2(board):
-    state = board._miniwins
-    final_state = state + np.random.randint(1,3, state.shape)*(state==0)
-    winner = winning_state.winner(final_state)
-    return winner
-
-def sim3(board):
-    state = board._board
-    final_state = state + np.random.randint(1,3, state.shape)*(state==0)
-    winner = winning_state.full_winner(final_state)
-    return winner
-
-def sim4(board):
-    sims = [sim1, sim2, sim3]
-    games = [0,0,0]
-    for sim in sims:
-        win = sim(board.clone())
-        games[win] += 1
-    return max([0,1,2], key=lambda x: games[x])
+    return simulations.random_walk(board)
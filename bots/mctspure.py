@@ -1,16 +1,18 @@
 from bots.base_bot import BaseBot
-from math import sqrt, log
-from time import time, sleep
-from random import choice, shuffle, randint, random
+from time import perf_counter
+from random import randrange
 import numpy as np
-import threading
 from simulations import mini_game
+from batch_playout import playout, tally, cell_array, amaf_counts
+from bots.transposition import TranspositionTable, position_key
+from bots.solver import Solver
+from bots.nodepool import NodePool
+from bots.clock import Clock, describe
+from bots.rave import get_schedule
+from bots.telemetry import SearchStats
 
 class Bot(BaseBot):
     def setup(self, *args):
-        self.tree = []
-        self.root_score = [0, 0]
-
         self.thinking_time = 15
         self.min_searches = 1000
         self.max_searches = 50000
@@ -18,8 +20,61 @@ class Bot(BaseBot):
         # Simulation mechanism
         self.simulate = mini_game
 
-        self.waiting = False
-        self.lock = threading.Lock()
+        # Endgame solver and its time budget (seconds)
+        self.solver = Solver()
+        self.solve_time = 5
+
+        # arg0 = transposition table size (0 to disable)
+        # Nodes for the same position share their statistics through the table
+        self.transpositions = None
+        if len(args) > 0 and int(args[0]) > 0:
+            self.transpositions = TranspositionTable(int(args[0]))
+
+        # arg1 = playouts per leaf
+        # More than one runs them as a lockstep batch (see batch_playout)
+        self.batch_size = 1
+        if len(args) > 1 and int(args[1]) > 1:
+            batch_size = self.batch_size = int(args[1])
+            self.simulate = lambda board: playout(board, batch_size)
+
+        # arg2 = symmetry depth
+        # Positions in the first few plies are looked up in the transposition
+        # table by their canonical form, so symmetric nodes share statistics
+        self.symmetry_depth = 0
+        if len(args) > 2:
+            self.symmetry_depth = int(args[2])
+            if self.symmetry_depth > 0 and self.transpositions is None:
+                self.transpositions = TranspositionTable()
+
+        # arg3 = game clock in seconds (0 to use thinking_time for every move)
+        game_time = None
+        if len(args) > 3 and float(args[3]) > 0:
+            game_time = float(args[3])
+        self.clock = Clock(self.thinking_time, game_time)
+
+        # arg4 = tree size limit in nodes (0 for no limit), at 18 bytes per node
+        # When the tree reaches it, the least visited subtrees are cut down
+        # to leaves until it is back to evict_to of the limit
+        self.max_nodes = None
+        self.evict_to = 0.75
+        if len(args) > 4 and int(args[4]) > 0:
+            self.max_nodes = max(int(args[4]), 1000)
+
+        # arg5 = RAVE schedule, eg. sqrt:1000 or mse:0.1 (0 to disable)
+        # Nodes keep all-moves-as-first statistics from every playout
+        # through their parent, blended into selection (see bots/rave.py)
+        self.schedule = None
+        if len(args) > 5:
+            self.schedule = get_schedule(args[5])
+
+        self.nodes = NodePool(max_capacity=self.max_nodes, rave=self.schedule is not None)
+        self.root = self.nodes.new_root()
+
+        self.counter = 0
+        self.turn_number = 0
+
+        # Search statistics for telemetry (None when it is off)
+        self.stats = SearchStats() if self.telemetry is not None else None
 
         # Optimal constants are theoretically sqrt(2), but
         # this causes a large amount of exploration.
@@ -34,154 +89,238 @@ class Bot(BaseBot):
         self.print_potential_moves = True
         self.print_expected_moves = True
 
+    def reroot(self, node):
+        # Make the node the new root, dropping the rest of the tree
+        # (or start a new tree if the node is None)
+        nodes = self.nodes
+        if node is None:
+            nodes.size = 0
+            if self.transpositions is not None:
+                self.transpositions.clear()
+            self.root = nodes.new_root()
+            return
+        self.moved(nodes.compact(node), node)
+
+    def evict(self):
+        # Shrink the tree to fit the node limit, keeping the root
+        size = self.nodes.size
+        self.moved(self.nodes.evict(self.root, int(self.max_nodes * self.evict_to)), self.root)
+        if self.stats is not None:
+            self.stats.pruned += size - self.nodes.size
+
+    def moved(self, mapping, root):
+        # Follow the nodes to their new indices after the pool was compacted
+        self.root = int(mapping[root])
+        if self.transpositions is not None:
+            self.transpositions.remap(lambda index: None if mapping[index] < 0 else int(mapping[index]))
+
     def start(self):
-        self.last_time = time()
+        self.clock.update()
         self.counter = 0
         self.turn_number = 0
 
-        # Thread process
-        def runner():
-            while self.board.winner is None:
-                self.lock.acquire()
-                # -- Guarantee we meet our minimum searches
-                for i in range(self.min_searches):
-                    self.search()
-                    sleep(0.000001)
-                self.waiting = True
-                self.lock.release()
-
-                # -- If we have time, keep searching
-                while self.waiting:
-                    self.lock.acquire()
-                    self.search()
-                    self.lock.release()
-                    sleep(0.00001)
-
-        self.thread = threading.Thread(target =runner)
-        self.thread.start()
+        # Search on both players' time
+        self.ponder()
+
+    def stop(self):
+        self.end_pondering()
 
     def search(self):
         # Update the root node using MCTS
-        winner = self._search(self.board.clone(), self.tree, self.root_score)
-        self._update_score(self.root_score, winner, self.board.player)
-        self.counter += 1
+        if self.max_nodes is not None and self.nodes.size + 81 > self.max_nodes:
+            self.evict()
+
+        stats = self.stats
+        if stats is not None:
+            t0 = perf_counter()
+
+        board = self.board.clone()
+        nodes = self.nodes
+        node = self.root
+        path = [node]
+        # Player whose wins each node on the path counts
+        players = [board.player]
 
-    def _search(self, board, tree, parent_score):
-        player = board.player
         ## Selection
-        if tree:
-            parent_score, score, move, subtree = self.get_best(tree, self.select_const)
-            board.move(*move)
-            winner = self._search(board, subtree, score)
-            # -- Fall through for backprop
+        while nodes.count[node] > 0:
+            node = nodes.select(node, self.select_const, self.schedule)
+            players.append(board.player)
+            board.move(*divmod(int(nodes.move[node]), 9))
+            path.append(node)
+
+        if stats is not None:
+            t1 = t2 = perf_counter()
+
+        final = None
+        if board.winner is not None:
+            # -- This leaf is terminal
+            winner = board.winner
+            if self.schedule is not None:
+                final = cell_array(board)
         else:
-            if board.winner is not None:
-                # -- This leaf is terminal
-                return board.winner
+            ## Expansion
+            moves = board.valid_indices()
+            first = nodes.expand(node, moves, self.shared_stats(board, moves))
+            node = first + randrange(len(moves))
+
+            ## Simulation
+            players.append(board.player)
+            board.move(*divmod(int(nodes.move[node]), 9))
+            path.append(node)
+            if stats is not None:
+                t2 = perf_counter()
+            if self.schedule is None:
+                winner = self.simulate(board)
+            elif self.batch_size > 1:
+                winner, final = playout(board, self.batch_size, record=True)
             else:
-                ## Expansion
-                options = board.get_valid()
-                for move in options:
-                    branch = [parent_score, [0,0], move, []]
-                    tree.append(branch)
-
-                branch = choice(tree)
-                parent_score, score, move, subtree = branch
-
-                ## Simulation
-                board.move(*move)
                 winner = self.simulate(board)
+                final = cell_array(board)
 
         ## Backprop
-        self._update_score(score, winner, player)
-        return winner
-
-    def get_best(self, tree, const):
-        # Returns the best move in the given tree or subtree
-        return max(tree, key=self.scoring_function(const))
-
-    def _update_score(self, score, winner, player):
-        # Updates the score for the player and winner
-        is_win = int(winner == player)
-        score[0] += is_win
-        score[1] += 1
-
-    def scoring_function(self, const):
-        # Return a function that can be used in sorting
-        return lambda branch: self.confidence(branch, const)
-
-    def confidence(self, branch, c):
-        # UCB formula
-        parent_score, score, move, subtree = branch
-        if score[1] == 0 or parent_score[1] == 0: return float('inf')
+        if stats is not None:
+            t3 = perf_counter()
+        wins1, games = tally(winner, 1)
+        wins2, _ = tally(winner, 2)
+        nodes.backprop(path, np.where(np.array(players) == 1, wins1, wins2), games)
+        if final is not None:
+            # Every cell taken in the playout counts for the children of
+            # the nodes where its owner was to move
+            nodes.backprop_amaf(path[:-1], players[1:], *amaf_counts(winner, final))
+        self.counter += 1
 
-        mean = score[0] / score[1]
-        return mean + c*sqrt(log(parent_score[1]) / score[1]) # UCB
+        if stats is not None:
+            stats.select += t1 - t0
+            stats.expand += t2 - t1
+            stats.simulate += t3 - t2
+            stats.backprop += perf_counter() - t3
+            stats.leaf(len(path) - 1, games)
+
+    def metrics(self):
+        # Search metrics for the move (see bots/telemetry.py)
+        metrics = self.stats.as_dict()
+        metrics['tree_nodes'] = self.nodes.size
+        metrics['tree_bytes'] = self.nodes.nbytes
+        metrics['root_visits'] = self.nodes.score(self.root)[1]
+        if self.transpositions is not None:
+            metrics['transpositions'] = len(self.transpositions)
+            metrics['transposition_hits'] = self.transpositions.hits
+        return metrics
+
+    def shared_stats(self, board, moves):
+        # Nodes holding the statistics of the children for the moves,
+        # shared through the transposition table (None if there is none)
+        if self.transpositions is None:
+            return None
+        first = self.nodes.size
+        stats = []
+        for i, move in enumerate(moves):
+            board.push(*divmod(int(move), 9))
+            stats.append(self.transpositions.setdefault(position_key(board, self.symmetry_depth), first + i))
+            board.pop()
+        return stats
+
+    def get_best(self, node, const):
+        # Returns the best child of the given node
+        return self.nodes.select(node, const)
+
+    def best_move(self, const=None):
+        # Returns the best move from the root
+        if const is None:
+            const = self.picking_const
+        return divmod(int(self.nodes.move[self.get_best(self.root, const)]), 9)
+
+    def root_stats(self):
+        # {move: (wins, visits)} for the root's children
+        wins, visits = self.nodes.child_stats(self.root)
+        moves = self.nodes.move[self.nodes.children(self.root)]
+        return {divmod(int(m), 9): (int(w), int(v)) for m, w, v in zip(moves, wins, visits)}
+
+    def print_moves(self, const):
+        # Prints the root's children, best first
+        nodes = self.nodes
+        select = nodes.confidence(self.root, self.select_const)
+        picking = nodes.confidence(self.root, const)
+        for i, k in enumerate(np.argsort(-picking, kind='stable')):
+            child = nodes.first[self.root] + k
+            print("{:4s}".format(str(i+1)), divmod(int(nodes.move[child]), 9), "->",
+                  "{:15s}".format(str(nodes.score(child))),
+                  "{:.3f}".format(select[k]), "({:.3f})".format(picking[k]))
 
     def request(self):
         # Ask the bot for a move
 
         print("My turn?")
-        # -- Give some time to think in case the state changed
-        while self.counter < self.max_searches and time() - self.last_time < self.thinking_time:
-            sleep(.5)
-            m = int(time()%4)
-            print('Hmm...', end='\r', flush=True)
-
+        start = self.clock.started()
+
+        # -- Play a proven win or draw when the endgame can be solved
+        move = self.solved_move(start)
+        if move is not None:
+            return move
+
+        # -- Give some time to think in case the state changed,
+        # making sure we meet our minimum searches
+        print('Hmm...', end='\r', flush=True)
+        budget = self.clock.budget(self.board)
+        reason = self.think(self.clock.deadline(budget, start),
+                            done=lambda: self.counter >= self.max_searches,
+                            enough=lambda: self.counter >= self.min_searches,
+                            latest=self.clock.latest(start))
+        # Keep the tree still while we read it, and charge the clock
+        # once the last search step is done
+        pondering = self.stop_pondering()
+        report = self.clock.charge(start, budget, reason)
         print("Okay, I got it.")
-
+        print(describe(report))
+
+        if self.nodes.count[self.root] == 0:
+            # Out of time before the root was ever expanded
+            move = self.board.random_valid()
+            print("No searches finished, choosing move {} at random".format(move))
+            if pondering:
+                self.ponder()
+            return move
         if self.print_potential_moves:
             print("-- Potential moves --")
-            for i,branch in enumerate(sorted(self.tree, key=self.scoring_function(self.picking_const), reverse=True)):
-                parent_score, score, move, subtree = branch
-                print("{:4s}".format(str(i+1)), move, "->", "{:15s}".format(str(score)),
-                      "{:.3f}".format(self.confidence(branch, self.select_const)),
-                        "({:.3f})".format(self.confidence(branch, self.picking_const)))
+            self.print_moves(self.picking_const)
 
         # Pick the move that is least likely to be a bad move
-        branch = self.get_best(self.tree, self.picking_const)
-        parent_score, score, move, subtree = branch
+        node = self.get_best(self.root, self.picking_const)
+        move = divmod(int(self.nodes.move[node]), 9)
+        confidence = self.nodes.confidence(self.root, self.picking_const)[node - self.nodes.first[self.root]]
         print()
-        print("Choosing move {} with score {} and confidence {:.3f}".format(move, score, self.confidence(branch, self.picking_const)))
-        print("  Root score was {}".format(self.root_score))
+        print("Choosing move {} with score {} and confidence {:.3f}".format(move, self.nodes.score(node), confidence))
+        print("  Root score was {}".format(self.nodes.score(self.root)))
         print()
+        if pondering:
+            self.ponder()
 
-        assert parent_score == self.root_score, self.tree
         return move
 
-    def update(self, last_player, last_turn):
+    def on_update(self, last_player, last_turn):
         # Cut the dead branches when a move is made
-        # We need to override the default behaviour
-        # because we're using threads
-
-        self.lock.acquire()
-        self.waiting = False
+        # (the search is paused, see BaseBot.update)
 
         # Print expected moves
-        if self.print_expected_moves and last_player != self.player:
+        expected = self.print_expected_moves and last_player != self.player and self.nodes.count[self.root] > 0
+        if expected:
             print("-- Expected moves --")
-            for i,branch in enumerate(sorted(self.tree, key=self.scoring_function(self.picking_const), reverse=True)):
-                parent_score, score, move, subtree = branch
-                print("{:4s}".format(str(i+1)), move, "->", "{:12s}".format(str(score)),
-                      "{:.3f}".format(self.confidence(branch, self.select_const)),
-                      "({:.3f})".format(self.confidence(branch, self.picking_const)))
-
-        super(Bot, self).update(last_player, last_turn)
-        for branch in self.tree:
-            parent_score, score, move, subtree = branch
-            if move == last_turn:
-                self.root_score = score
-                self.tree = subtree
-                break
-
-        if self.print_expected_moves and last_player != self.player:
+            self.print_moves(self.picking_const)
+
+        node = self.nodes.find_child(self.root, last_turn)
+
+        if expected and node is not None:
+            confidence = self.nodes.confidence(self.root, self.picking_const)[node - self.nodes.first[self.root]]
             print()
-            print("Opponent played {} with score {} and confidence {:.3f}".format(move, score, self.confidence(branch, self.picking_const)))
-            print("  Root score was {}".format(parent_score))
+            print("Opponent played {} with score {} and confidence {:.3f}".format(last_turn, self.nodes.score(node), confidence))
+            print("  Root score was {}".format(self.nodes.score(self.root)))
             print()
 
-        self.last_time = time()
+        self.reroot(node)
+
+        self.clock.update()
         self.counter = 0
         self.turn_number += 1
-        self.lock.release()
-
+        # Telemetry for our next move covers the search from our last one
+        if self.stats is not None and last_player == self.player:
+            self.stats.reset()
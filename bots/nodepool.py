@@ -0,0 +1,244 @@
+"""
+Array-backed storage for MCTS trees.
+"""
+import numpy as np
+
+class NodePool:
+    """
+    Struct-of-arrays node store. A node is an index into the arrays:
+        wins, visits    statistics (used through stat, see below)
+        move            move leading to the node, as 9*row + col
+        first, count    children, which are allocated together as the
+                        slice first:first+count (count 0 for a leaf)
+        stat            node whose wins and visits this node uses. It is
+                        the node itself unless it shares its statistics
+                        with another node (eg. a transposition).
+    That is 18 bytes per node. The arrays grow by doubling when full, up
+    to max_capacity nodes if it is given.
+
+    With rave, nodes also keep AMAF statistics (8 more bytes per node):
+        amaf_wins, amaf_visits  playouts from the parent in which the
+                                node's move was played by the same player
+    These belong to the node itself and are never shared through stat.
+    """
+    def __init__(self, capacity=65536, max_capacity=None, rave=False):
+        if max_capacity is not None:
+            capacity = min(capacity, max_capacity)
+        self.max_capacity = max_capacity
+        self.rave = rave
+        self.size = 0
+        self.shared = False
+        self.wins = np.zeros(capacity, dtype='int32')
+        self.visits = np.zeros(capacity, dtype='int32')
+        self.move = np.zeros(capacity, dtype='uint8')
+        self.first = np.zeros(capacity, dtype='int32')
+        self.count = np.zeros(capacity, dtype='uint8')
+        self.stat = np.zeros(capacity, dtype='int32')
+        if rave:
+            self.amaf_wins = np.zeros(capacity, dtype='int32')
+            self.amaf_visits = np.zeros(capacity, dtype='int32')
+
+    @property
+    def capacity(self):
+        return len(self.wins)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self._arrays())
+
+    def _arrays(self):
+        if self.rave:
+            return ('wins', 'visits', 'move', 'first', 'count', 'stat', 'amaf_wins', 'amaf_visits')
+        return ('wins', 'visits', 'move', 'first', 'count', 'stat')
+
+    def allocate(self, n):
+        """ Allocate n new nodes, returning the index of the first """
+        if self.size + n > self.capacity:
+            extra = max(self.capacity, self.size + n - self.capacity)
+            if self.max_capacity is not None:
+                extra = max(min(extra, self.max_capacity - self.capacity), self.size + n - self.capacity)
+            for name in self._arrays():
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros(extra, dtype=array.dtype)]))
+        start = self.size
+        self.size += n
+        nodes = slice(start, self.size)
+        self.wins[nodes] = 0
+        self.visits[nodes] = 0
+        self.first[nodes] = 0
+        self.count[nodes] = 0
+        self.stat[nodes] = np.arange(start, self.size)
+        if self.rave:
+            self.amaf_wins[nodes] = 0
+            self.amaf_visits[nodes] = 0
+        return start
+
+    def new_root(self):
+        return self.allocate(1)
+
+    def expand(self, node, moves, stats=None):
+        """
+        Give the node one child per move (an array of 9*row + col indices),
+        optionally sharing the statistics of the given nodes.
+        Returns the index of the first child.
+        """
+        n = len(moves)
+        first = self.allocate(n)
+        self.first[node] = first
+        self.count[node] = n
+        self.move[first:first+n] = moves
+        if stats is not None:
+            self.stat[first:first+n] = stats
+            self.shared = True
+        return first
+
+    def children(self, node):
+        return range(self.first[node], self.first[node] + self.count[node])
+
+    def child_stats(self, node):
+        # wins and visits of the node's children
+        a = self.first[node]
+        b = a + self.count[node]
+        if self.shared:
+            stat = self.stat[a:b]
+            return self.wins[stat], self.visits[stat]
+        return self.wins[a:b], self.visits[a:b]
+
+    def score(self, node):
+        # [wins, visits] of the node
+        s = self.stat[node]
+        return [int(self.wins[s]), int(self.visits[s])]
+
+    def confidence(self, node, c, schedule=None):
+        """
+        UCB values of the node's children (inf if unvisited).
+        With a RAVE schedule (see bots/rave.py), the mean is blended with
+        the AMAF mean, and children with AMAF playouts are no longer
+        treated as unvisited.
+        """
+        wins, visits = self.child_stats(node)
+        parent_visits = self.visits[self.stat[node]]
+        if parent_visits == 0:
+            return np.full(len(visits), np.inf)
+        visits = visits.astype(float)
+        if schedule is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ucb = wins / visits + c*np.sqrt(np.log(parent_visits) / visits)
+            ucb[visits == 0] = np.inf
+            return ucb
+
+        a = self.first[node]
+        b = a + self.count[node]
+        amaf_visits = self.amaf_visits[a:b].astype(float)
+        seen = amaf_visits > 0
+        amaf_mean = np.where(seen, self.amaf_wins[a:b] / np.maximum(amaf_visits, 1), 0)
+        beta = np.where(seen, schedule(visits, amaf_visits), 0)
+        mean = np.where(visits > 0, wins / np.maximum(visits, 1), 0)
+        ucb = (1 - beta)*mean + beta*amaf_mean + c*np.sqrt(np.log(parent_visits) / np.maximum(visits, 1))
+        ucb[(visits == 0) & ~seen] = np.inf
+        return ucb
+
+    def select(self, node, c, schedule=None):
+        """ Child of the node with the best UCB value """
+        return int(self.first[node] + np.argmax(self.confidence(node, c, schedule)))
+
+    def find_child(self, node, move):
+        # The child reached by the (row, col) move, or None
+        a = self.first[node]
+        found = np.flatnonzero(self.move[a:a+self.count[node]] == 9*move[0] + move[1])
+        if len(found) == 0:
+            return None
+        return int(a + found[0])
+
+    def backprop(self, path, wins, visits):
+        # Add wins (an array, one per node) and visits to the nodes in the path
+        stat = self.stat[path]
+        self.wins[stat] += wins
+        self.visits[stat] += visits
+
+    def backprop_amaf(self, path, players, played, won):
+        """
+        Update the AMAF statistics of the children of the nodes in the path.
+        players[k] is the player to move at path[k]. played[p] and won[p]
+        count, by cell (9*row + col), the playouts in which player p took
+        the cell, and those of them that p won. A child's cell was empty
+        at its parent, so taking it at all means taking it after the parent.
+        """
+        for node, player in zip(path, players):
+            children = self.children(node)
+            if len(children) == 0:
+                continue
+            children = slice(children.start, children.stop)
+            moves = self.move[children]
+            self.amaf_visits[children] += played[player][moves]
+            self.amaf_wins[children] += won[player][moves]
+
+    def _levels(self, root):
+        # The tree under root level by level, with each level's parents
+        levels = [np.array([root])]
+        parents = [np.array([-1])]
+        frontier = levels[0]
+        while len(frontier):
+            counts = self.count[frontier].astype(int)
+            expanded = frontier[counts > 0]
+            counts, starts = counts[counts > 0], self.first[expanded]
+            # Concatenated ranges starts[i] : starts[i] + counts[i]
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            frontier = offsets + np.arange(counts.sum())
+            levels.append(frontier)
+            parents.append(np.repeat(expanded, counts))
+        return levels, parents
+
+    def compact(self, root):
+        """
+        Keep only the tree under root, moved to the front of the pool.
+        Returns an array mapping old node indices to new ones (-1 if dropped).
+        """
+        levels, _ = self._levels(root)
+        old = np.concatenate(levels)
+
+        mapping = np.full(self.size, -1, dtype='int32')
+        mapping[old] = np.arange(len(old))
+
+        # Nodes sharing statistics with a dropped node take a copy of them
+        stat = self.stat[old]
+        new_stat = mapping[stat]
+        new_stat[new_stat < 0] = np.flatnonzero(new_stat < 0)
+
+        n = len(old)
+        self.wins[:n] = self.wins[stat]
+        self.visits[:n] = self.visits[stat]
+        self.move[:n] = self.move[old]
+        count = self.count[old]
+        self.first[:n] = np.where(count > 0, mapping[self.first[old]], 0)
+        self.count[:n] = count
+        self.stat[:n] = new_stat
+        if self.rave:
+            self.amaf_wins[:n] = self.amaf_wins[old]
+            self.amaf_visits[:n] = self.amaf_visits[old]
+        self.size = n
+        return mapping
+
+    def evict(self, root, max_nodes):
+        """
+        Shrink the tree under root to at most max_nodes nodes by turning
+        the least visited expanded nodes back into leaves. A collapsed node
+        keeps its statistics, which already include its dropped subtree.
+        Compacts the pool and returns the mapping (see compact).
+        """
+        levels, parents = self._levels(root)
+        visits = self.visits[self.stat[:self.size]]
+        # Fewest visits among each node's ancestors below the root: a node
+        # survives a cut at v visits iff that is at least v
+        ancestor_visits = np.full(self.size, np.iinfo('int32').max, dtype='int64')
+        for level, parent in zip(levels[2:], parents[2:]):
+            ancestor_visits[level] = np.minimum(ancestor_visits[parent], visits[parent])
+        old = np.concatenate(levels)
+
+        if len(old) > max_nodes:
+            # Smallest cut that leaves at most max_nodes nodes
+            kept = np.sort(ancestor_visits[old])[::-1]
+            cut = kept[max_nodes] + 1
+            collapse = old[(ancestor_visits[old] >= cut) & (visits[old] < cut) & (old != root)]
+            self.count[collapse] = 0
+        return self.compact(root)
@@ -0,0 +1,144 @@
+"""
+Root-parallel MCTS.
+
+Runs several independent search trees in worker processes, so the Python
+bots can use more than one core despite the GIL. Every worker gets the
+same board and move updates, and the root statistics of all the trees
+are merged when a move is requested.
+"""
+from bots.base_bot import BaseBot
+import bots
+from bots.solver import Solver
+from bots.clock import Clock, describe
+from multiprocessing import Process, Pipe
+import os
+import sys
+import random
+import numpy as np
+
+# Messages to the workers
+UPDATE, STATS, STOP = range(3)
+
+def worker(conn, board, player, name, args):
+    # Search until told otherwise, answering messages between searches
+    sys.stdout = open(os.devnull, 'w')
+    random.seed()
+    np.random.seed()
+
+    bot = bots.get_bot(name)(board, player, *args)
+    while True:
+        if board.winner is not None or conn.poll():
+            message = conn.recv()
+            if message[0] == UPDATE:
+                bot.update(*message[1:])
+                bot.counter = 0
+                # Expand the new root before the next update arrives
+                if board.winner is None:
+                    bot.search()
+            elif message[0] == STATS:
+                conn.send((bot.root_stats(), bot.counter))
+            else:
+                break
+        else:
+            bot.search()
+    conn.close()
+
+class Bot(BaseBot):
+    """
+    Arguments: <workers> <bot name> [bot args*]
+
+    The bot must be an MCTS bot with search() and root_stats()
+    (mcts or mctsplus).
+    """
+    def setup(self, *args):
+        self.num_workers = int(args[0])
+        self.bot_name = args[1]
+        self.bot_args = args[2:]
+
+        self.thinking_time = 15
+        self.clock = Clock(self.thinking_time)
+
+        # Endgame solver and its time budget (seconds)
+        self.solver = Solver()
+        self.solve_time = 5
+
+        self.print_potential_moves = True
+        self.searches = 0
+
+    def start(self):
+        self.workers = []
+        for i in range(self.num_workers):
+            conn, child_conn = Pipe()
+            process = Process(target=worker, args=(child_conn, self.board.clone(), self.player, self.bot_name, self.bot_args))
+            process.daemon = True
+            process.start()
+            self.workers.append((process, conn))
+        self.clock.update()
+        print("Searching with {} workers".format(self.num_workers))
+
+    def stop(self):
+        for process, conn in self.workers:
+            conn.send((STOP,))
+        for process, conn in self.workers:
+            process.join()
+
+    def update(self, last_player, last_move):
+        super(Bot, self).update(last_player, last_move)
+        for process, conn in self.workers:
+            conn.send((UPDATE, last_player, last_move))
+        self.clock.update()
+
+    def metrics(self):
+        return {'searches': self.searches, 'workers': self.num_workers}
+
+    def root_stats(self):
+        # Merged {move: (wins, visits)} of all the trees,
+        # and the number of searches done since the last move
+        merged = {}
+        searches = 0
+        for process, conn in self.workers:
+            conn.send((STATS,))
+        for process, conn in self.workers:
+            stats, counter = conn.recv()
+            searches += counter
+            for move, (wins, visits) in stats.items():
+                total = merged.get(move, (0, 0))
+                merged[move] = (total[0] + wins, total[1] + visits)
+        return merged, searches
+
+    def request(self):
+        print("My turn?")
+        start = self.clock.started()
+
+        # -- Play a proven win or draw when the endgame can be solved
+        move = self.solved_move(start)
+        if move is not None:
+            return move
+
+        print('Hmm...', end='\r', flush=True)
+        report = self.clock.wait(self.board, start=start)
+        print("Okay, I got it.")
+        print(describe(report))
+
+        stats, searches = self.root_stats()
+        self.searches = searches
+        if not stats:
+            # Out of time before any worker expanded the root
+            move = self.board.random_valid()
+            print("No searches finished, choosing move {} at random".format(move))
+            return move
+        # The most visited move is the one the trees agree on most
+        ranked = sorted(stats, key=lambda move: stats[move][1], reverse=True)
+        if self.print_potential_moves:
+            print("-- Potential moves --")
+            for i, move in enumerate(ranked):
+                wins, visits = stats[move]
+                print("{:4s}".format(str(i+1)), move, "->", "{:15s}".format(str([wins, visits])),
+                      "{:.3f}".format(wins / max(visits, 1)))
+
+        move = ranked[0]
+        print()
+        print("Choosing move {} with score {}".format(move, list(stats[move])))
+        print("  {} searches over {} workers".format(searches, self.num_workers))
+        print()
+        return move
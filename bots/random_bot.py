@@ -1,7 +1,5 @@
 from bots.base_bot import BaseBot
 
-import random
-
 class Bot(BaseBot):
     def request(self):
-        return random.choice(self.board.get_valid())
+        return self.board.random_valid()
@@ -0,0 +1,43 @@
+"""
+RAVE (all-moves-as-first) blending schedules.
+
+A node's AMAF statistics count every playout in which its move was
+played later by the same player, not just the ones through the node.
+They are biased but plentiful, so selection blends them in as
+    (1 - beta) * mean + beta * amaf_mean
+with beta going from 1 to 0 as the node's own visits grow.
+
+Schedules take (visits, amaf_visits), as numbers or NumPy arrays:
+    sqrt:K  beta = sqrt(K / (3*visits + K)), about 1/2 at K visits
+    mse:B   beta = amaf / (visits + amaf + 4*B*B*visits*amaf), from
+            minimising the error of the blend for an AMAF bias B
+"""
+import numpy as np
+
+def sqrt_schedule(k=1000):
+    return lambda visits, amaf_visits: np.sqrt(k / (3.0*visits + k))
+
+def mse_schedule(bias=0.1):
+    def beta(visits, amaf_visits):
+        total = visits + amaf_visits + 4*bias*bias*visits*amaf_visits
+        return np.where(total > 0, amaf_visits / np.maximum(total, 1e-9), 1.0)
+    return beta
+
+SCHEDULES = {
+    'sqrt': sqrt_schedule,
+    'mse': mse_schedule,
+}
+
+def get_schedule(spec):
+    """
+    Schedule for a 'name:parameter' spec (eg. 'sqrt:1000'),
+    or None if the spec turns RAVE off ('0' or 'none')
+    """
+    if spec in ('0', 'none', '', None):
+        return None
+    name, _, param = spec.partition(':')
+    if name not in SCHEDULES:
+        raise ValueError("Unknown RAVE schedule '{}'".format(name))
+    if param:
+        return SCHEDULES[name](float(param))
+    return SCHEDULES[name]()
@@ -1,40 +1,36 @@
 """
 Collection of simulation functions for MCTS
+
+These score a board for one player using the playout policies in the
+top level simulations module.
 """
 import numpy as np
-import winning_state
-import random
+import simulations
 
-def random_final(player):
+def random_final(player, samples=1):
+    # Scores `samples` random fills of the 9x9 board in one batch,
+    # returning the fraction won by the player (None if all are ties)
+    policy = simulations.fill_cells(samples)
     def _helper(board):
-        state = board._board
-        final_state = state + np.random.randint(1,3, state.shape)*(state == 0)
-        winner = winning_state.full_board_winning_state(final_state, player)
-        assert winner != 0
-        if winner == 3:
-            return None
-        else:
-            if winner == player:
-                print("sim", player, "win")
-            return int(winner == player)
+        return _score(policy(board), player)
     return _helper
 
-def random_mini_final(player):
+def random_mini_final(player, samples=1):
+    # Same as random_final, but fills the 3x3 board of mini-board results
+    policy = simulations.fill_miniwins(samples)
     def _helper(board):
-        state = board._miniwins
-        final_state = state + np.random.randint(1,3, state.shape)*(state==0)
-        winner = winning_state.winning_state(final_state, player)
-        assert winner != 0
-        if winner == 3:
-            return None
-        else:
-            return int(winner == player)
+        return _score(policy(board), player)
     return _helper
 
+def _score(winners, player):
+    winners = np.reshape(winners, -1)
+    decided = winners != 0
+    if not decided.any():
+        return None
+    return float((winners[decided] == player).mean())
+
 def random_game(player):
     def _helper(board):
-        while board.winner is None:
-            move = random.choice(board.get_valid())
-            board.move(*move)
-        return None if board.winner == 0 else board.winner == player
-    return _helper
\ No newline at end of file
+        winner = simulations.random_walk(board)
+        return None if winner == 0 else winner == player
+    return _helper
@@ -0,0 +1,131 @@
+"""
+Exact endgame solver.
+
+Alpha-beta search over the whole remaining game with make/unmake
+(Board.push/pop), move ordering and a transposition table. It proves the
+game-theoretic value of a position instead of estimating it with playouts,
+so it is only practical once few cells are left or the active boards
+keep the tree narrow.
+"""
+from time import time
+
+from bots.transposition import TranspositionTable
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+# Transposition table entry bounds
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class OutOfTime(Exception):
+    pass
+
+class Solver:
+    """
+    Values are for the player to move: WIN, DRAW or LOSS.
+    The transposition table is kept between calls, so later solves
+    reuse what earlier ones proved.
+    """
+    def __init__(self, table_size=100000, max_empty=24, max_moves=4, max_constrained_empty=28):
+        self.table = TranspositionTable(table_size)
+        self.nodes = 0
+
+        # Positions worth trying (see worth_trying)
+        self.max_empty = max_empty
+        self.max_moves = max_moves
+        self.max_constrained_empty = max_constrained_empty
+
+    def worth_trying(self, board):
+        """
+        Whether the tree is likely small enough to solve: few empty cells,
+        or a move constrained to a nearly full board with not many more.
+        """
+        if board.winner is not None:
+            return False
+        if board.turns_left <= self.max_empty:
+            return True
+        return board.turns_left <= self.max_constrained_empty and board.num_valid() <= self.max_moves
+
+    def solve(self, board, time_limit=None):
+        """
+        Solve the board, returning (value, best move), or None if the time
+        limit (in seconds) runs out first. The board is not modified.
+        """
+        board = board.clone()
+        self.nodes = 0
+        self._deadline = None if time_limit is None else time() + time_limit
+        try:
+            value = self._negamax(board, LOSS, WIN)
+        except OutOfTime:
+            return None
+        value, _, move = self.table.get(board.hash)
+        return value, move
+
+    def _negamax(self, board, alpha, beta):
+        self.nodes += 1
+        if self._deadline is not None and self.nodes & 63 == 0 and time() > self._deadline:
+            raise OutOfTime()
+
+        best_move = None
+        entry = self.table.get(board.hash)
+        if entry is not None:
+            value, bound, best_move = entry
+            if bound == EXACT:
+                return value
+            elif bound == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        original_alpha = alpha
+        player = board.player
+        best = LOSS - 1
+        for move in self._ordered_moves(board, best_move):
+            winner = board.push(*move)
+            if winner is None:
+                value = -self._negamax(board, -beta, -alpha)
+            elif winner == 0:
+                value = DRAW
+            else:
+                value = WIN if winner == player else LOSS
+            board.pop()
+
+            if value > best:
+                best, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best <= original_alpha:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.put(board.hash, (best, bound, best_move))
+        return best
+
+    def _ordered_moves(self, board, first=None):
+        # Previous best move first, then moves that end the game, win a
+        # mini-board or keep the opponent in a single board
+        player = board.player
+        closed = board._closed
+        scored = []
+        for move in board.get_valid():
+            if move == first:
+                scored.append((-1, move))
+                continue
+            winner = board.push(*move)
+            if winner is not None:
+                score = 0 if winner == player else 3
+            else:
+                score = 2
+                if board._closed != closed:
+                    score -= 1
+                if board._next_board is None:
+                    score += 1
+            board.pop()
+            scored.append((score, move))
+        scored.sort()
+        return [move for score, move in scored]
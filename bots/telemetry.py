@@ -0,0 +1,98 @@
+"""
+Per-move search telemetry.
+
+Set UTTT_TELEMETRY to a file name (or '-' for stdout) and every move a
+bot makes is appended to it as one JSON object per line, eg.
+
+    {"bot": "bots.mctspure", "player": 1, "ply": 12, "move": [4, 5],
+     "time": 15.0, "searches": 40210, "playouts_per_sec": 2680.4,
+     "tree_nodes": 612345, "tree_bytes": 11022210, "depth_max": 9,
+     "depth_avg": 5.1, "select": 4.2, "expand": 1.1, "simulate": 8.3,
+     "backprop": 1.2, ...}
+
+When it is not set there is no sink, the bots keep no SearchStats and
+the search loops only pay for an `is not None` check.
+"""
+import json
+import os
+import sys
+import threading
+from time import time
+
+ENV = 'UTTT_TELEMETRY'
+
+class Sink:
+    """ Writes records as JSON lines; safe to share between threads """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if path == '-':
+            self.file = sys.stdout
+        else:
+            self.file = open(path, 'a')
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+_sinks = {}
+
+def get_sink(path=None):
+    """ The sink for the path (UTTT_TELEMETRY by default), or None if unset """
+    if path is None:
+        path = os.environ.get(ENV)
+    if not path:
+        return None
+    if path not in _sinks:
+        _sinks[path] = Sink(path)
+    return _sinks[path]
+
+class SearchStats:
+    """
+    Counters a search loop fills in for the current move:
+    searches, playouts, seconds spent in each phase, the depth of the
+    leaves reached and how many nodes were pruned.
+    """
+    __slots__ = ('start', 'searches', 'playouts', 'select', 'expand', 'simulate',
+                 'backprop', 'depth_sum', 'depth_max', 'pruned')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start = time()
+        self.searches = 0
+        self.playouts = 0
+        self.select = 0.0
+        self.expand = 0.0
+        self.simulate = 0.0
+        self.backprop = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.pruned = 0
+
+    def leaf(self, depth, playouts):
+        # Count a finished search that reached the given depth
+        self.searches += 1
+        self.playouts += playouts
+        self.depth_sum += depth
+        if depth > self.depth_max:
+            self.depth_max = depth
+
+    def as_dict(self):
+        elapsed = max(time() - self.start, 1e-9)
+        return {
+            'searches': self.searches,
+            'playouts': self.playouts,
+            'playouts_per_sec': self.playouts / elapsed,
+            'search_time': elapsed,
+            'depth_max': self.depth_max,
+            'depth_avg': self.depth_sum / max(self.searches, 1),
+            'select': self.select,
+            'expand': self.expand,
+            'simulate': self.simulate,
+            'backprop': self.backprop,
+            'pruned': self.pruned,
+        }
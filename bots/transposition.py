@@ -0,0 +1,75 @@
+"""
+Transposition table for the MCTS bots
+"""
+from collections import OrderedDict
+from symmetry import canonical_hash
+
+class TranspositionTable:
+    """
+    Maps a position's Zobrist hash (Board.hash) to its node statistics,
+    so that nodes reached through different move orders can share them.
+
+    The table holds at most max_size entries. When it is full, the least
+    recently used entry is dropped. What that does depends on the bot:
+    in mctscomplex, where values are scores, the next node at the
+    position to be updated carries on from its own score and stores it
+    again. In mctspure, where values are NodePool indices, nodes that
+    already share the entry's pool node keep sharing it, and nodes
+    expanded later at the position get statistics of their own. When
+    the pool drops a shared node (remap maps it to None), each node that
+    shared it keeps a copy of its statistics (see NodePool.compact).
+    """
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def setdefault(self, key, default):
+        # Returns the stored value, storing the default if there is none
+        value = self.get(key)
+        if value is None:
+            self.put(key, default)
+            value = default
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def remap(self, update):
+        # Replaces every value with update(value), dropping those mapped to None
+        entries = OrderedDict()
+        for key, value in self._entries.items():
+            value = update(value)
+            if value is not None:
+                entries[key] = value
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+def position_key(board, symmetry_depth=0):
+    # Table key for the board. Positions in the first symmetry_depth plies
+    # use their canonical hash, so symmetric positions share an entry.
+    if 81 - board.turns_left <= symmetry_depth:
+        return canonical_hash(board)
+    return board.hash
@@ -1,10 +1,11 @@
-import socket
 import threading
 import warnings
 from socket_helper import *
+import protocol
+import transport as transports
 
 class Client:
-    def __init__(self, bot_const, host=None, port=11001):
+    def __init__(self, bot_const, host=None, port=11001, version=protocol.VERSION, transport=None):
         """
         :param bot_const: A bot constructor that creates a bot object
             A bot must implement 2 methods:
@@ -12,16 +13,23 @@ class Client:
                 request(valid_moves)
             The bot is responsible for maintaining its own correct
             copy of the board
+        :param version: Protocol version to ask the server for
+            (1 for servers that only speak the original protocol)
+        :param transport: How to reach the server
+            (see transport.py; TCP to the host and port by default)
         """
         self._bot_const = bot_const
         self._bot = None
+        self._version = version
+        # Packets are in the original protocol until the handshake is done
+        self._protocol = 1
 
-        if host is None:
-            host = socket.gethostname()
+        if transport is None:
+            transport = transports.TCP(host, port)
 
-        print("Trying to connect to {}:{} ... ".format(host,port), end='',flush=True)
-        self._client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._client.connect((host,port))
+        print("Trying to connect to {} ... ".format(transport), end='',flush=True)
+        self._client = transport.connect()
+        self._conn = Connection(self._client)
         print("Success!")
 
         self._thread = None
@@ -37,12 +45,40 @@ class Client:
         else:
             self._recv()
 
+    def join(self):
+        """ Wait for a threaded client to finish its game """
+        if self._thread is not None:
+            self._thread.join()
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
     def _recv(self):
+        # Stop the bot and close our end however the game ends, so the
+        # server is not left waiting on a client whose bot failed
+        try:
+            self._play()
+        finally:
+            try:
+                if self._bot is not None:
+                    self._bot.stop()
+            finally:
+                self.close()
+
+    def _play(self):
         while True:
-            header = recv_int(self._client)
+            if self._protocol != 1:
+                kind, fields = protocol.recv_frame(self._conn)
+                if kind == protocol.TURN:
+                    self._receive_turn(*fields)
+                elif kind == protocol.GAME_OVER:
+                    self._receive_gameover_v2(*fields)
+                    break
+                else:
+                    print("#### WARNING: Received unexpected frame type", kind)
+                continue
+
+            header = self._conn.recv_int()
             if header == 0:
                 self._receive_move_request()
             elif header == 1:
@@ -55,16 +91,15 @@ class Client:
             else:
                 print("#### WARNING: Received unknown packet type", header)
 
-        self.close()
-
 
     def _receive_move_request(self):
         """
         REQUEST_MOVE:
         0: HEADER (0)
         """
-        move = self._bot.request()
+        move = self._bot.play()
         self._send_move(move)
+        self._bot.report()
 
     def _receive_player_id(self):
         """
@@ -74,13 +109,14 @@ class Client:
         """
         if self._bot is None:
             print("Initializing bot...")
-            player = recv_int(self._client)
+            player = self._conn.recv_int()
             self._bot = self._bot_const(player)
             self._id = player
             self._bot.start()
 
             print("Telling the server we're ready")
             self._send_ack()
+            self._protocol = self._version
 
             print("Bot initialized successfully!")
             print("You are player", player)
@@ -95,16 +131,40 @@ class Client:
             2:      SIZEOF(LAST_MOVE) (int)
             3:      LAST_MOVE (position)
         """
-        last_player = recv_int(self._client)
-        size = recv_int(self._client)
-        last_move_data = recv(self._client, size)
-        last_move = tuple(p for p in last_move_data)
+        last_player = self._conn.recv_int()
+        size = self._conn.recv_int()
+        last_move = tuple(self._conn.recv(size))
 
         self._bot.update(last_player, last_move)
 
+    def _receive_turn(self, last_player, last_move, clock, move_limit):
+        """
+        TURN frame (see protocol.py)
+        The opponent's move, then ours, which we apply as we send it
+        """
+        # (synced first, so the bot's clock starts when the turn arrives)
+        self._bot.sync_clock(protocol.decode_time(clock), protocol.decode_time(move_limit))
+        if last_player != 0:
+            self._bot.update(last_player, protocol.decode_move(last_move))
+        move = tuple(self._bot.play())
+        self._conn.sendall(protocol.move(move))
+        self._bot.report()
+        self._bot.update(self._id, move)
+
+    def _receive_gameover_v2(self, winner, last_player, last_move):
+        """
+        GAME OVER frame (see protocol.py)
+        """
+        if last_player != 0 and last_player != self._id:
+            self._bot.update(last_player, protocol.decode_move(last_move))
+        self._game_over(winner)
+
     def _receive_gameover(self):
+        winner = self._conn.recv_int()
+        self._game_over(winner)
+
+    def _game_over(self, winner):
         print("GAME OVER")
-        winner = recv_int(self._client)
         if winner == 0:
             print("Game is a tie!")
         else:
@@ -112,7 +172,6 @@ class Client:
                 print("You win!")
             else:
                 print("You lose.")
-        self._bot.stop()
 
 
     def _send_move(self, move):
@@ -123,18 +182,22 @@ class Client:
             2:  OPTION (int)
         """
         packet = pack(2, len(move), *move)
-        send(self._client, packet)
+        self._conn.sendall(packet)
 
     def _send_ack(self):
         """
         ACK
             0:  HEADER (200)
+        or ACK_V2 (see protocol.py)
         """
-        packet = pack(200)
-        send(self._client, packet)
+        self._conn.sendall(protocol.handshake(self._version))
 
     def close(self):
         if not self._closed:
-            self._client.shutdown(0)
+            try:
+                self._client.shutdown(0)
+            except OSError:
+                # (the server already hung up)
+                pass
             self._client.close()
         self._closed = True
@@ -0,0 +1,65 @@
+"""
+Latency histograms for the hosts.
+
+Bucket i counts the latencies under 2**i milliseconds (and at least
+2**(i-1), for i > 0), so a histogram is a fixed list of counts that
+can be merged across games to find slow bots and tail regressions.
+"""
+
+class Histogram:
+    BUCKETS = 18  # The last one also takes everything over 2**16 ms
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[min(int(ms).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        # Upper bound in seconds on the latency at the given percentile (0-100)
+        if self.count == 0:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(2 ** i / 1000, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / max(self.count, 1)
+
+    def summary(self):
+        return "{} moves, mean {:.3f}s, p50 <{:.3f}s, p90 <{:.3f}s, p99 <{:.3f}s, max {:.3f}s".format(
+            self.count, self.mean(), self.percentile(50), self.percentile(90),
+            self.percentile(99), self.max)
+
+    def pprint(self, width=40):
+        # Bars for the buckets from the first to the last one used
+        used = [i for i, count in enumerate(self.counts) if count]
+        if not used:
+            return
+        peak = max(self.counts)
+        for i in range(used[0], used[-1] + 1):
+            bar = '#' * int(round(width * self.counts[i] / peak))
+            print("  <{:>8s} {:6d} {}".format(_format_ms(2 ** i), self.counts[i], bar))
+
+def _format_ms(ms):
+    if ms < 1000:
+        return "{}ms".format(ms)
+    return "{:g}s".format(ms / 1000)
@@ -0,0 +1,115 @@
+"""
+Opening book for Ultimate Tic-Tac-Toe.
+
+The book maps positions from the first few plies to a move found by a
+deep offline search. Positions are stored by their canonical form (see
+symmetry.py), so one entry answers for all eight symmetric copies.
+
+File format (little endian):
+    HEADER:  MAGIC (4 bytes, b'UTTB'), VERSION (1 byte), COUNT (4 bytes)
+    ENTRY:   HASH (8 bytes, canonical Zobrist hash), MOVE (1 byte, 9*row + col
+             in the canonical position)
+Entries are sorted by hash.
+
+Build a book with
+
+        python3 opening_book.py book.dat --plies 3 --searches 5000
+"""
+import argparse
+import struct
+from time import time
+
+from board import Board
+from symmetry import canonical, transform_move, INVERSE
+
+MAGIC = b'UTTB'
+VERSION = 1
+HEADER = struct.Struct('<4sBI')
+ENTRY = struct.Struct('<QB')
+
+class OpeningBook:
+    def __init__(self, entries=None):
+        # canonical hash -> canonical move
+        self.entries = dict(entries or {})
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, 'rb') as f:
+            data = f.read()
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("'{}' is not a version {} opening book".format(fname, VERSION))
+        entries = {}
+        for i in range(count):
+            key, index = ENTRY.unpack_from(data, HEADER.size + i*ENTRY.size)
+            entries[key] = divmod(index, 9)
+        return cls(entries)
+
+    def save(self, fname):
+        with open(fname, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.entries)))
+            for key in sorted(self.entries):
+                r, c = self.entries[key]
+                f.write(ENTRY.pack(key, 9*r + c))
+
+    def add(self, board, move):
+        position, t = canonical(board)
+        self.entries[position.hash] = transform_move(move, t)
+
+    def lookup(self, board):
+        """ The book move for the board, or None if it is out of book """
+        position, t = canonical(board)
+        move = self.entries.get(position.hash)
+        if move is None:
+            return None
+        move = transform_move(move, INVERSE[t])
+        # Guard against hash collisions
+        if move not in board.get_valid():
+            return None
+        return move
+
+    def __len__(self):
+        return len(self.entries)
+
+def search_move(board, searches, bot_args=()):
+    # Best move for the board after a fixed number of MCTS searches
+    from bots.mctspure import Bot
+    bot = Bot(board.clone(), board.player, *bot_args)
+    bot.counter = 0
+    for _ in range(searches):
+        bot.search()
+    return bot.best_move()
+
+def build(plies, searches, bot_args=(), verbose=True):
+    """
+    Build a book covering every position in the first `plies` plies,
+    searching each distinct (up to symmetry) position once.
+    """
+    book = OpeningBook()
+    layer = [Board()]
+    for ply in range(plies):
+        start = time()
+        next_layer = {}
+        for board in layer:
+            book.add(board, search_move(board, searches, bot_args))
+            for move in board.get_valid():
+                child = board.clone()
+                child.move(*move)
+                if child.winner is None:
+                    next_layer.setdefault(canonical(child)[0].hash, child)
+        if verbose:
+            print("Ply {}: {} positions in {:.1f}s".format(ply, len(layer), time() - start))
+        layer = list(next_layer.values())
+    return book
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Opening book builder for Ultimate Tic-Tac-Toe")
+    parser.add_argument("book", help="Filename to save the book to")
+    parser.add_argument("--plies", type=int, default=3, help="Number of plies to cover")
+    parser.add_argument("--searches", type=int, default=5000, help="MCTS searches per position")
+    parser.add_argument("bot_args", nargs='*', help="Arguments for the mcts bot doing the searches")
+
+    args = parser.parse_args()
+    book = build(args.plies, args.searches, args.bot_args)
+    book.save(args.book)
+    print("Saved {} positions to {}".format(len(book), args.book))
@@ -0,0 +1,111 @@
+"""
+Wire protocol, version 2.
+
+Version 1 (see server.py) sends every field as its own byte and the
+reader picks the packets apart one recv at a time. A ply costs a move
+request, a move and an update to each player.
+
+A client asks for version 2 by answering PLAYER_ID with
+        ACK_V2 (1 byte, 201)
+        VERSION (1 byte, 2)
+instead of ACK (200). Every message after that is one frame:
+        LENGTH (1 byte, the size of the rest of the frame)
+        TYPE (1 byte)
+        FIELDS (struct packed, see below)
+
+Turn (Incoming):
+    The opponent's last move and a request for ours, in one frame,
+    with the time controls for the move
+        TYPE = 1
+        LAST_PLAYER (1 byte, 0 before the first move)
+        LAST_MOVE (1 byte, NO_MOVE before the first move)
+        CLOCK (4 bytes, milliseconds left on our game clock, or NO_TIME)
+        MOVE_LIMIT (4 bytes, milliseconds this move may take, or NO_TIME)
+Move (Outgoing):
+        TYPE = 2
+        MOVE (1 byte)
+Game Over (Incoming):
+        TYPE = 10
+        WINNER (1 byte, 0 for a tie)
+        LAST_PLAYER (1 byte, 0 unless the game ended with a move)
+        LAST_MOVE (1 byte, NO_MOVE unless the game ended with a move)
+
+A move is sent as one byte, 9*row + col. The player who moves applies
+its own move as soon as it is sent; the opponent gets it with its next
+Turn (or the Game Over), so there are no separate updates.
+"""
+import struct
+
+VERSION = 2
+
+# Handshake replies to PLAYER_ID
+ACK = 200
+ACK_V2 = 201
+
+# Frame types
+TURN = 1
+MOVE = 2
+GAME_OVER = 10
+
+NO_MOVE = 255
+NO_TIME = 0xFFFFFFFF
+
+_FIELDS = {
+    TURN: struct.Struct('!BBII'),
+    MOVE: struct.Struct('!B'),
+    GAME_OVER: struct.Struct('!BBB'),
+}
+
+def encode_move(move):
+    if move is None:
+        return NO_MOVE
+    row, col = move
+    return 9*row + col
+
+def decode_move(index):
+    if index == NO_MOVE:
+        return None
+    if index >= 81:
+        raise ValueError("Move index {} is off the board".format(index))
+    return divmod(index, 9)
+
+def encode_time(seconds):
+    if seconds is None:
+        return NO_TIME
+    return min(max(0, int(seconds * 1000)), NO_TIME - 1)
+
+def decode_time(ms):
+    if ms == NO_TIME:
+        return None
+    return ms / 1000
+
+def frame(kind, *fields):
+    # A whole frame, ready to send
+    body = _FIELDS[kind].pack(*fields)
+    return bytes((len(body) + 1, kind)) + body
+
+def parse(payload):
+    # (type, fields) of a frame without its length byte
+    kind = payload[0]
+    if kind not in _FIELDS:
+        raise ValueError("Unknown frame type {}".format(kind))
+    return kind, _FIELDS[kind].unpack_from(payload, 1)
+
+def turn(last_player, last_move, clock=None, move_limit=None):
+    return frame(TURN, last_player, encode_move(last_move), encode_time(clock), encode_time(move_limit))
+
+def move(move):
+    return frame(MOVE, encode_move(move))
+
+def game_over(winner, last_player, last_move):
+    return frame(GAME_OVER, winner, last_player, encode_move(last_move))
+
+def handshake(version):
+    # Reply to PLAYER_ID speaking the given version
+    if version == 1:
+        return bytes((ACK,))
+    return bytes((ACK_V2, version))
+
+def recv_frame(conn):
+    # (type, fields) of the next frame from a socket_helper.Connection
+    return parse(conn.recv_frame())
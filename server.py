@@ -31,24 +31,53 @@ an option should then be repacked into 1-dimensional
 form when sending back
 
 Players should connect to port 11001
+
+Clients that answer PLAYER_ID with ACK_V2 speak the framed
+protocol in protocol.py instead, and get their time controls
+with each move request.
+
+Time controls:
+    With a game clock, each player has game_time seconds for all its moves,
+    measured from the move request being sent to the move arriving.
+    With a move limit, no move may take more than move_time seconds.
+    A player that runs out of either loses the game.
 """
 import socket
 import time
 from socket_helper import *
+from latency import Histogram
+import protocol
+import transport as transports
 
 class Server:
-    def __init__(self, board, host=None, port=11001):
+    def __init__(self, board, host=None, port=11001, game_time=None, move_time=None,
+                 transport=None, linger=3, handshake_timeout=30):
+        """
+        :param transport: Where to listen for the players
+            (see transport.py; TCP on the host and port by default)
+        :param linger: Seconds to wait after the game before closing
+        :param handshake_timeout: Seconds a player has to set up its bot
+            and acknowledge its player id (None to wait forever)
+        """
         self._players = []
         self._addresses = []
+        self._versions = []
         self._board = board
 
-        if host is None:
-            host = socket.gethostname()
+        # Seconds left on each player's clock (None for no clock)
+        self.clocks = {1: game_time, 2: game_time}
+        self._move_time = move_time
+        # Request to move latency of each player
+        self.latency = {1: Histogram(), 2: Histogram()}
 
-        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._server.bind((host, port))
-        self._server.listen(2)
+        # Winner once the game is over (0 for a tie)
+        self.winner = None
+        self._linger = linger
+        self._handshake_timeout = handshake_timeout
+
+        if transport is None:
+            transport = transports.TCP(host, port)
+        self._server = transport.listen(2)
 
         self._closed = False
 
@@ -58,33 +87,78 @@ class Server:
 
         self._connect()
 
+        last_player, last_move = 0, None
+        winner = None
         while self._board.winner is None:
             player_num = self._board.player
             turn = player_num - 1
             player = self._players[turn]
+            version = self._versions[turn]
 
             print("Player", player_num)
             self._board.pprint()
 
-            self._send_request_move(player)
-            move = self._receive_move(player)
-            print("Received move:", move)
+            # (this also sends the update still queued for the player)
+            limit = self._time_limit(player_num)
+            start = time.time()
+            player.settimeout(limit)
+            try:
+                if version == 1:
+                    self._send_request_move(player)
+                    player.flush()
+                    move = self._receive_move(player)
+                else:
+                    player.send(protocol.turn(last_player, last_move, self.clocks[player_num], self._move_time))
+                    player.flush()
+                    move = self._receive_move_v2(player)
+            except socket.timeout:
+                move = None
+            finally:
+                player.settimeout(None)
+
+            elapsed = time.time() - start
+            self.latency[player_num].add(elapsed)
+            if self.clocks[player_num] is not None:
+                self.clocks[player_num] -= elapsed
+            if move is None or (limit is not None and elapsed > limit):
+                print("Player {} ran out of time after {:.3f}s".format(player_num, elapsed))
+                winner = 3 - player_num
+                # (both players have seen the last move)
+                last_player, last_move = 0, None
+                break
+            print("Received move:", move, "in {:.3f}s".format(elapsed))
 
             self._board.move(*move)
+            last_player, last_move = player_num, move
 
-            for sock in self._players:
-                self._send_update(sock, player_num, move)
+            # (v2 players get the move with their next turn)
+            # The opponent's update goes out with its move request
+            for sock, version in zip(self._players, self._versions):
+                if version == 1:
+                    self._send_update(sock, player_num, move)
+            player.flush()
 
+        if winner is None:
+            winner = self._board.winner
         self._board.pprint()
-        if self._board.winner == 0:
+        if winner == 0:
             print("Game is a tie!")
         else:
-            print("Player", self._board.winner, "wins!")
+            print("Player", winner, "wins!")
+
+        for num in (1, 2):
+            print("Player {} latency: {}".format(num, self.latency[num].summary()))
+            self.latency[num].pprint()
 
-        for sock in self._players:
-            self._send_gameover(sock, self._board.winner)
+        for sock, version in zip(self._players, self._versions):
+            if version == 1:
+                self._send_gameover(sock, winner)
+            else:
+                sock.send(protocol.game_over(winner, last_player, last_move))
+            sock.flush()
 
-        time.sleep(3)
+        self.winner = winner
+        time.sleep(self._linger)
         self.close()
 
     def _connect(self):
@@ -93,25 +167,39 @@ class Server:
             print("Waiting for player", len(self._players)+1, "...", end=' ',flush=True)
 
             (client, address) = self._server.accept()
+            conn = Connection(client)
             try:
-                self._send_player_id(client, count)
+                conn.settimeout(self._handshake_timeout)
+                self._send_player_id(conn, count)
+                conn.flush()
 
-                if self._receive_ack(client):
-                    self._players.append(client)
+                version = self._receive_ack(conn)
+                conn.settimeout(None)
+                if version is not None:
+                    self._players.append(conn)
                     self._addresses.append(address)
+                    self._versions.append(version)
 
                     count += 1
-                    print("Success!")
+                    print("Success! (protocol v{})".format(version))
                 else:
                     print("Failed.")
                     client.shutdown(socket.SHUT_RDWR)
                     client.close()
-            except ConnectionError as e:
+            except (ConnectionError, socket.timeout) as e:
                 print("Failed:", e)
                 client.shutdown(socket.SHUT_RDWR)
                 client.close()
                 continue
 
+    def _time_limit(self, player_num):
+        # Seconds the player's next move may take (None for no limit)
+        limits = [t for t in (self.clocks[player_num], self._move_time) if t is not None]
+        if not limits:
+            return None
+        # (a zero timeout would make the socket non-blocking)
+        return max(0.001, min(limits))
+
     def _send_player_id(self, sock, num):
         """
         PLAYER_ID
@@ -119,7 +207,7 @@ class Server:
             1: ID (int)
         """
         packet = pack(4, num)
-        send(sock, packet)
+        sock.send(packet)
 
     def _send_request_move(self, sock):
         """
@@ -127,7 +215,7 @@ class Server:
             0: HEADER (0)
         """
         packet = pack(0)
-        send(sock, packet)
+        sock.send(packet)
 
     def _send_update(self, sock, player, move):
         """
@@ -138,7 +226,7 @@ class Server:
             3:      LAST_MOVE (position)
         """
         packet = pack(1, player, len(move), *move)
-        send(sock, packet)
+        sock.send(packet)
 
     def _send_gameover(self, sock, winner):
         """
@@ -147,16 +235,25 @@ class Server:
             1:  WINNER (int)
         """
         packet = pack(10, winner)
-        send(sock, packet)
+        sock.send(packet)
 
     def _receive_ack(self, sock):
         """
         ACK:
             0: HEADER (200)
+        or
+        ACK_V2:
+            0: HEADER (201)
+            1: VERSION (int)
+
+        Returns the protocol version, or None for a bad ACK
         """
-        header = recv_int(sock)
-        if header != 200: return False
-        return True
+        header = sock.recv_int()
+        if header == protocol.ACK:
+            return 1
+        if header == protocol.ACK_V2 and sock.recv_int() == protocol.VERSION:
+            return protocol.VERSION
+        return None
 
     def _receive_move(self, sock):
         """
@@ -165,16 +262,26 @@ class Server:
             1:  SIZEOF(OPTION) (int)
             2:  OPTION (int)
         """
-        header = recv_int(sock)
+        header = sock.recv_int()
         assert header == 2, "Control flow issue. Expected to receive move header, got {}".format(header)
-        size = recv_int(sock)
-        packet = recv(sock, size)
-        return tuple(p for p in packet)
+        size = sock.recv_int()
+        packet = sock.recv(size)
+        return tuple(packet)
+
+    def _receive_move_v2(self, sock):
+        """
+        MOVE frame (see protocol.py)
+        """
+        kind, fields = protocol.recv_frame(sock)
+        assert kind == protocol.MOVE, "Control flow issue. Expected to receive a move frame, got {}".format(kind)
+        return protocol.decode_move(fields[0])
 
     def close(self):
         if not self._closed:
             self._server.shutdown(socket.SHUT_RDWR)
             self._server.close()
+            for sock in self._players:
+                sock.close()
         self._closed = True
 
     def __exit__(self, exc_type, exc_val, exc_tb):
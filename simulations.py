@@ -1,9 +1,29 @@
-from random import choice
+"""
+Playout policies.
+
+A policy takes a Board, which it may play on (so pass a copy), and
+returns the winner: 0 for a tie, 1 or 2. Policies that play several
+games at once return an array of winners instead (see batch_playout.tally).
+
+POLICIES maps each name to a factory taking an optional integer
+parameter, and get_policy('batch:32') builds a policy from a name.
+
+Compare the policies' speed and accuracy with
+
+        python3 simulations.py --positions 40 --playouts 256
+"""
+import argparse
+from time import time
+
 import numpy as np
+import winning_state
+from batch_playout import playout
+from board import Board
 
 def random_walk(board):
+    # Play random moves until the game is over
     while board.winner is None:
-        board.move(*choice(board.get_valid()))
+        board.move(*board.random_valid())
     return board.winner
 
 def mini_game(board):
@@ -18,29 +38,132 @@ def mini_game(board):
     # simulation time doing that).
     if board.turns_left < 50:
         for move in board.get_valid():
-            B = board.clone()
-            B.move(*move)
-            if B.winner is not None and B.winner > 0: return B.winner
+            winner = board.push(*move)
+            board.pop()
+            if winner is not None and winner > 0: return winner
 
     # Random walk
     while board.winner is None and turns > 0:
-        options = board.get_valid()
-        board.move(*choice(options))
+        board.move(*board.random_valid())
         turns -= 1
     if board.winner is not None:
         return board.winner
 
     # Perform a mini-win approximation
-    state = board._miniwins
-    final_state = state + np.random.randint(1,3, state.shape)*(state==0)
-    for p in [1,2]:
-        for i in range(3):
-            if (final_state[:,i] == p).all():
-                return p
-            if (final_state[i,:] == p).all():
-                return p
-    if final_state[0,0] == final_state[1,1] == final_state[2,2]:
-        return final_state[1,1]
-    if final_state[2,0] == final_state[1,1] == final_state[0,2]:
-        return final_state[1,1]
-    return 0
+    return int(winning_state.winners(winning_state.random_fill(board._miniwins))[0])
+
+def fill_miniwins(samples=1):
+    # Give every open mini-board to a random player and score the result
+    def _policy(board):
+        winners = winning_state.winners(winning_state.random_fill(board._miniwins, samples))
+        return int(winners[0]) if samples == 1 else winners
+    return _policy
+
+def fill_cells(samples=1):
+    # Give every empty cell to a random player and score the result
+    def _policy(board):
+        winners = winning_state.full_winners(winning_state.random_fill(board._board, samples))
+        return int(winners[0]) if samples == 1 else winners
+    return _policy
+
+def trials(board):
+    # Majority vote of a random walk, a mini-board fill and a cell fill
+    games = [0,0,0]
+    for policy in (random_walk, fill_miniwins(), fill_cells()):
+        games[policy(board.clone())] += 1
+    return max([0,1,2], key=lambda x: games[x])
+
+def batch(n=64):
+    # n random walks at once (see batch_playout)
+    return lambda board: playout(board, n)
+
+POLICIES = {
+    'random': lambda: random_walk,
+    'mini': lambda: mini_game,
+    'miniwins': fill_miniwins,
+    'cells': fill_cells,
+    'trials': lambda: trials,
+    'batch': batch,
+}
+
+def get_policy(spec):
+    """ Policy for a 'name' or 'name:parameter' spec (eg. 'batch:32') """
+    name, _, param = spec.partition(':')
+    if name not in POLICIES:
+        raise ValueError("Unknown playout policy '{}'".format(name))
+    if param:
+        return POLICIES[name](int(param))
+    return POLICIES[name]()
+
+# Benchmark
+
+def random_positions(count, seed=0):
+    # Unfinished positions from random games, spread over the game
+    rng = np.random.RandomState(seed)
+    positions = []
+    while len(positions) < count:
+        board = Board()
+        plies = rng.randint(0, 60)
+        for _ in range(plies):
+            if board.winner is not None:
+                break
+            moves = board.get_valid()
+            board.move(*moves[rng.randint(len(moves))])
+        if board.winner is None:
+            positions.append(board)
+    return positions
+
+def value(winners, player):
+    # Mean score for the player: 1 for a win, 1/2 for a tie
+    winners = np.reshape(winners, -1)
+    return float(np.mean(np.where(winners == player, 1.0, np.where(winners == 0, 0.5, 0.0))))
+
+def benchmark(names, positions, playouts, reference_games=2000):
+    """
+    Play `playouts` games of each policy on every position (calling
+    batch policies until they have played that many, and dropping the
+    extra games, so every policy has the same sample size), and compare
+    its mean value for the player to move with the reference: the value
+    over reference_games random walks. Returns rows of
+        (name, games per second, RMS error, agreement)
+    where agreement is how often the policy and the reference favour the
+    same player.
+    """
+    reference = [value(playout(board, reference_games), board.player) for board in positions]
+    rows = []
+    for name in names:
+        policy = get_policy(name)
+        games = 0
+        errors = []
+        agree = 0
+        start = time()
+        for board, expected in zip(positions, reference):
+            results = []
+            played = 0
+            while played < playouts:
+                winners = np.reshape(policy(board.clone()), -1)
+                results.append(winners)
+                played += len(winners)
+            games += played
+            results = np.concatenate(results)[:playouts]
+            estimate = value(results, board.player)
+            errors.append(estimate - expected)
+            agree += (estimate - 0.5)*(expected - 0.5) > 0 or estimate == expected
+        elapsed = time() - start
+        rms = float(np.sqrt(np.mean(np.square(errors))))
+        rows.append((name, games / elapsed, rms, agree / len(positions)))
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the playout policies")
+    parser.add_argument("policies", nargs='*', default=sorted(POLICIES), help="Policies to compare (eg. batch:32)")
+    parser.add_argument("--positions", type=int, default=40, help="Number of test positions")
+    parser.add_argument("--playouts", type=int, default=256, help="Games per position")
+    parser.add_argument("--reference", type=int, default=2000, help="Random games per position for the reference value")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the test positions")
+
+    args = parser.parse_args()
+    positions = random_positions(args.positions, args.seed)
+    print("{:12s} {:>12s} {:>10s} {:>10s}".format("policy", "games/sec", "RMS error", "agreement"))
+    for name, rate, rms, agreement in benchmark(args.policies, positions, args.playouts, args.reference):
+        print("{:12s} {:12.0f} {:10.3f} {:9.0f}%".format(name, rate, rms, 100*agreement))
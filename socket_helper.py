@@ -23,3 +23,83 @@ def recv(sock, N):
 
 def recv_int(sock):
     return recv(sock, 1)[0]
+
+class Connection:
+    """
+    Buffered socket for the server and client.
+
+    Reads go through recv_into a preallocated buffer, so one syscall
+    usually brings in a whole message (or several), and the fields are
+    parsed out of memoryviews of the buffer without copying. A view is
+    only good until the next read.
+
+    Writes are queued by send and go out in one sendall on flush.
+    """
+    def __init__(self, sock, size=4096):
+        self.sock = sock
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        # Unread data is _buffer[_start:_end]
+        self._start = 0
+        self._end = 0
+        self._out = []
+
+    def _fill(self, n):
+        # Buffer at least n unread bytes
+        if n > len(self._buffer):
+            raise ValueError("Cannot buffer {} bytes".format(n))
+        if self._start + n > len(self._buffer):
+            # Move the unread bytes to the front to make room
+            unread = self._end - self._start
+            self._buffer[:unread] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, unread
+        while self._end - self._start < n:
+            received = self.sock.recv_into(self._view[self._end:])
+            if received == 0:
+                raise ConnectionError("Socket input stream broken")
+            self._end += received
+
+    def recv(self, n):
+        # The next n bytes, as a view of the buffer
+        assert n > 0
+        self._fill(n)
+        start = self._start
+        self._start += n
+        if self._start == self._end:
+            self._start = self._end = 0
+        return self._view[start:start + n]
+
+    def recv_int(self):
+        self._fill(1)
+        value = self._buffer[self._start]
+        self._start += 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        return value
+
+    def recv_frame(self):
+        # The body of a length-prefixed frame (see protocol.py)
+        return self.recv(self.recv_int())
+
+    def send(self, packet):
+        # Queue a packet until the next flush
+        self._out.append(packet)
+
+    def flush(self):
+        if self._out:
+            packet = self._out[0] if len(self._out) == 1 else b''.join(self._out)
+            self._out = []
+            self.sock.sendall(packet)
+
+    def sendall(self, packet):
+        self.send(packet)
+        self.flush()
+
+    def settimeout(self, seconds):
+        self.sock.settimeout(seconds)
+
+    def shutdown(self, how):
+        self.sock.shutdown(how)
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,103 @@
+"""
+Symmetries of the Ultimate Tic-Tac-Toe board.
+
+The 9x9 board has the eight symmetries of the square (the D4 group).
+Each one moves the mini-boards and the cells inside them the same way,
+so the rule sending a player to the board matching their cell still
+holds and transformed games are legal games.
+
+Transforms are numbered 0-7 and act on (row, col) as:
+    0: identity         4: flip rows
+    1: rotate 90        5: flip cols
+    2: rotate 180       6: transpose
+    3: rotate 270       7: anti-transpose
+"""
+from board import Board, zobrist, _bit_index
+
+TRANSFORMS = (
+    lambda r, c, n: (r, c),
+    lambda r, c, n: (c, n-r),
+    lambda r, c, n: (n-r, n-c),
+    lambda r, c, n: (n-c, r),
+    lambda r, c, n: (n-r, c),
+    lambda r, c, n: (r, n-c),
+    lambda r, c, n: (c, r),
+    lambda r, c, n: (n-c, n-r),
+)
+
+# Transform that undoes each transform
+INVERSE = (0, 3, 2, 1, 4, 5, 6, 7)
+
+def _bit_position(k):
+    b, i = divmod(k, 9)
+    return 3*(b//3) + i//3, 3*(b%3) + i%3
+
+# Where each cell bit and mini-board bit goes under each transform
+_CELL_PERMS = tuple(tuple(_bit_index(*f(*_bit_position(k), 8)) for k in range(81))
+                    for f in TRANSFORMS)
+_BOARD_PERMS = tuple(tuple(3*r + c for r, c in (f(b//3, b%3, 2) for b in range(9)))
+                     for f in TRANSFORMS)
+
+def _permute(mask, perm):
+    result = 0
+    while mask:
+        low = mask & -mask
+        result |= 1 << perm[low.bit_length() - 1]
+        mask ^= low
+    return result
+
+def transform_move(move, t):
+    """ Apply transform t to a (row, col) move """
+    return TRANSFORMS[t](move[0], move[1], 8)
+
+def transform_moves(moves, t):
+    return [transform_move(move, t) for move in moves]
+
+def transform_position(position, t):
+    """ Apply transform t to a Position """
+    cells, boards = _CELL_PERMS[t], _BOARD_PERMS[t]
+    next_board = position.next_board
+    if next_board is not None:
+        next_board = TRANSFORMS[t](next_board[0], next_board[1], 2)
+    last_move = position.last_move
+    if last_move is not None:
+        last_move = transform_move(last_move, t)
+    position = position._replace(
+        free=_permute(position.free, cells),
+        cells1=_permute(position.cells1, cells),
+        cells2=_permute(position.cells2, cells),
+        macro1=_permute(position.macro1, boards),
+        macro2=_permute(position.macro2, boards),
+        closed=_permute(position.closed, boards),
+        next_board=next_board,
+        last_move=last_move)
+    return position._replace(hash=zobrist(position))
+
+def transform_board(board, t):
+    return Board.from_snapshot(transform_position(board.snapshot(), t))
+
+def canonical(board):
+    """
+    Canonical form of a Board or Position: the transformed position with
+    the smallest cells and active board, along with the transform t that
+    produced it.
+    Moves map to the canonical form with transform_move(move, t) and back
+    with transform_move(move, INVERSE[t]).
+    """
+    position = board.snapshot() if isinstance(board, Board) else board
+
+    def key(t):
+        active = -1
+        if position.next_board is not None:
+            r, c = TRANSFORMS[t](position.next_board[0], position.next_board[1], 2)
+            active = 3*r + c
+        return (_permute(position.cells1, _CELL_PERMS[t]),
+                _permute(position.cells2, _CELL_PERMS[t]),
+                active)
+
+    t = min(range(len(TRANSFORMS)), key=key)
+    return transform_position(position, t), t
+
+def canonical_hash(board):
+    """ Zobrist hash shared by every symmetric copy of the position """
+    return canonical(board)[0].hash
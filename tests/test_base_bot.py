@@ -0,0 +1,63 @@
+"""
+Run with: python -m pytest tests
+"""
+import threading
+from time import time, sleep
+import pytest
+from board import Board
+from bots.base_bot import BaseBot
+
+class Bot(BaseBot):
+    # Searches by counting, failing at step fail_at if it is given
+    def setup(self, fail_at=None):
+        self.steps = 0
+        self.fail_at = fail_at
+
+    def stop(self):
+        self.end_pondering()
+
+    def search(self):
+        self.steps += 1
+        if self.steps == self.fail_at:
+            raise ValueError("search failed")
+
+def run(target, timeout=5):
+    # Runs target in a thread, failing the test if it does not return
+    result = {}
+    def call():
+        try:
+            target()
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=call, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "Hung waiting on the pondering thread"
+    return result.get('error')
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_failed_search_reaches_stop_pondering():
+    bot = Bot(Board(), 1, 10)
+    bot.ponder()
+    deadline = time() + 5
+    while bot._thread is not None and time() < deadline:
+        sleep(0.001)
+    assert isinstance(run(bot.stop_pondering), ValueError)
+    # Once raised, the error is not raised again
+    assert run(bot.stop_pondering) is None
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_failed_search_reaches_think():
+    bot = Bot(Board(), 1, 10)
+    assert isinstance(run(lambda: bot.think(time() + 60)), ValueError)
+
+def test_stop_ends_the_pondering_thread():
+    bot = Bot(Board(), 1)
+    bot.ponder()
+    thread = bot._thread
+    assert run(bot.stop) is None
+    thread.join(5)
+    assert not thread.is_alive()
+    # Pondering does not start again once stopped
+    bot.ponder()
+    assert bot._thread is None
@@ -0,0 +1,125 @@
+"""
+The bitboard Board against a plain reference implementation of the rules
+(the original array-based board, written with lists).
+
+Run with: python -m pytest tests
+"""
+import random
+import pytest
+from board import Board, zobrist
+
+LINES = [[(r, 0), (r, 1), (r, 2)] for r in range(3)] + \
+        [[(0, c), (1, c), (2, c)] for c in range(3)] + \
+        [[(0, 0), (1, 1), (2, 2)], [(0, 2), (1, 1), (2, 0)]]
+
+def winning_state(cells, player):
+    # player if they have a line in the 3x3 cells, 3 if it is full, else 0
+    if any(all(cells[r][c] == player for r, c in line) for line in LINES):
+        return player
+    if all(cells[r][c] != 0 for r in range(3) for c in range(3)):
+        return 3
+    return 0
+
+class Reference:
+    def __init__(self):
+        self.board = [[0]*9 for _ in range(9)]
+        self.miniwins = [[0]*3 for _ in range(3)]
+        self.next_board = None
+        self.winner = None
+        self.player = 1
+        self.turns_left = 81
+
+    def move(self, row, col):
+        player = self.player
+        (br, mr), (bc, mc) = divmod(row, 3), divmod(col, 3)
+        self.board[row][col] = player
+        self.turns_left -= 1
+
+        mini = [[self.board[3*br + r][3*bc + c] for c in range(3)] for r in range(3)]
+        miniwin = winning_state(mini, player)
+        if miniwin:
+            self.miniwins[br][bc] = miniwin
+        # Make sure the next board doesn't have a winner
+        self.next_board = (mr, mc) if self.miniwins[mr][mc] == 0 else None
+        if miniwin:
+            big_win = winning_state(self.miniwins, player)
+            if big_win == player:
+                self.winner = player
+            elif big_win > 0:
+                # Big game tie! (the player to move stays the same)
+                self.winner = 0
+                return
+        elif self.turns_left == 0:
+            self.winner = 0
+        self.player = 3 - player
+
+    def get_valid(self):
+        if self.next_board is None:
+            return [(r, c) for r in range(9) for c in range(9)
+                    if self.board[r][c] == 0 and self.miniwins[r//3][c//3] == 0]
+        br, bc = self.next_board
+        return [(3*br + r, 3*bc + c) for r in range(3) for c in range(3)
+                if self.board[3*br + r][3*bc + c] == 0]
+
+def check(board, reference):
+    assert sorted(board.get_valid()) == reference.get_valid()
+    assert board.num_valid() == len(reference.get_valid())
+    assert board.winner == reference.winner
+    assert board.player == reference.player
+    assert board.turns_left == reference.turns_left
+    assert board._next_board == reference.next_board
+    assert board._board.tolist() == reference.board
+    assert board._miniwins.tolist() == reference.miniwins
+    assert board.hash == zobrist(board.snapshot())
+
+@pytest.mark.parametrize('seed', range(200))
+def test_random_games_match_the_reference(seed):
+    rng = random.Random(seed)
+    board, reference = Board(), Reference()
+    check(board, reference)
+    while board.winner is None:
+        # Every legal move can be pushed and popped back to the same position
+        before = board.snapshot()
+        for move in board.get_valid():
+            board.push(*move)
+            assert board.pop() == move
+            assert board.snapshot() == before
+            assert board.snapshot().hash == before.hash
+            assert board._last_move == before.last_move
+
+        move = rng.choice(reference.get_valid())
+        board.move(*move)
+        reference.move(*move)
+        check(board, reference)
+
+def test_push_pop_over_a_whole_game():
+    rng = random.Random(7)
+    board = Board()
+    positions = [board.snapshot()]
+    while board.winner is None:
+        board.push(*rng.choice(board.get_valid()))
+        positions.append(board.snapshot())
+    while len(positions) > 1:
+        positions.pop()
+        board.pop()
+        assert board.snapshot() == positions[-1]
+        assert board.hash == positions[-1].hash
+    with pytest.raises(IndexError):
+        board.pop()
+
+def test_zobrist_hashes_are_stable():
+    # Seeded, so opening books and tables keyed by hash stay valid
+    board = Board()
+    assert board.hash == 11647240206562080520
+    board.move(4, 4)
+    assert board.hash == 3818487392023286411
+
+def test_transpositions_share_a_hash():
+    # The same cells, active board and player to move, in two move orders
+    a, b = Board(), Board()
+    for move in [(3, 3), (0, 2), (0, 7), (1, 4), (4, 3), (4, 1)]:
+        a.move(*move)
+    for move in [(4, 3), (4, 1), (3, 3), (0, 2), (0, 7), (1, 4)]:
+        b.move(*move)
+    assert a.snapshot() == b.snapshot()
+    assert a.hash == b.hash
@@ -0,0 +1,55 @@
+"""
+Run with: python -m pytest tests
+"""
+import itertools
+from board import Board
+from bots import mctscomplex
+
+def make_bot():
+    # Random playouts, simple priorities, 1s and 0-10000 evaluations,
+    # sharing through a transposition table
+    return mctscomplex.Bot(Board(), 1, 'random', 'simple', 1, 0, 10000, 1000)
+
+def nodes(tree):
+    yield tree
+    for subtree in tree.subtrees:
+        if subtree is not None:
+            yield from nodes(subtree)
+
+def test_abandoned_steps_leave_the_tree_intact():
+    bot = make_bot()
+    for _ in range(200):
+        bot.search()
+    counter = bot.counter
+    expanded = {id(tree): len(tree.moves) for tree in nodes(bot.tree)}
+
+    # Every step now stops at its expansion, as if the search were paused
+    bot.stopping = lambda: True
+    for _ in range(50):
+        bot.search()
+    assert bot.counter == counter
+
+    for tree in nodes(bot.tree):
+        # No half expanded nodes, and every child is still selectable
+        assert len(tree.moves) == expanded.get(id(tree), 0)
+        assert {i for _, i in tree.heap} == set(range(len(tree.moves)))
+
+def test_abandoned_expansion_shares_nothing():
+    # The search is paused after two of the root's branches are simulated
+    bot = make_bot()
+    calls = itertools.count()
+    bot.stopping = lambda: next(calls) >= 2
+    bot.search()
+    assert bot.tree.moves == []
+    assert len(bot.transpositions) == 0
+
+def test_rave_blends_only_the_mean():
+    # With the AMAF mean equal to the child's own mean, blending them
+    # leaves the UCB priority (and its exploration term) alone
+    bot = mctscomplex.Bot(Board(), 1, 'random', 'ucb', 1, 0, 10000, 0, 0, 0, 'sqrt:10')
+    tree = mctscomplex.Node()
+    tree.add((0, 0), (3, 8))
+    tree.add((0, 1), (5, 12))
+    tree.amaf[0] = (7, 18)
+    priority = bot.get_priority(tree.total, tree.scores[0])
+    assert abs(bot.rave_priority(tree, 0) + priority) < 1e-12
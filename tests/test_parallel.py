@@ -0,0 +1,14 @@
+"""
+Run with: python -m pytest tests
+"""
+from board import Board
+from bots import parallel
+
+def test_random_move_before_the_root_is_expanded():
+    # No worker has expanded the root when the move is due, so the
+    # merged root statistics are empty
+    bot = parallel.Bot(Board(), 1, '2', 'mcts')
+    bot.workers = []
+    bot.sync_clock(None, 0.1)
+    move = bot.request()
+    assert move in bot.board.get_valid()
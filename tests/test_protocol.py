@@ -0,0 +1,80 @@
+"""
+Framing of protocol v2, and reading frames through socket_helper.Connection.
+
+Run with: python -m pytest tests
+"""
+import socket
+import pytest
+import protocol
+from socket_helper import Connection
+
+def test_frames_round_trip():
+    cases = [
+        (protocol.turn(0, None), (protocol.TURN, (0, protocol.NO_MOVE, protocol.NO_TIME, protocol.NO_TIME))),
+        (protocol.turn(2, (4, 7), 12.5, 0.3), (protocol.TURN, (2, 43, 12500, 300))),
+        (protocol.move((8, 8)), (protocol.MOVE, (80,))),
+        (protocol.game_over(1, 1, (0, 0)), (protocol.GAME_OVER, (1, 1, 0))),
+    ]
+    for data, expected in cases:
+        # The length byte counts the rest of the frame
+        assert data[0] == len(data) - 1
+        assert protocol.parse(data[1:]) == expected
+
+def test_moves_and_times():
+    for index in range(81):
+        assert protocol.encode_move(protocol.decode_move(index)) == index
+    assert protocol.decode_move(protocol.NO_MOVE) is None
+    with pytest.raises(ValueError):
+        protocol.decode_move(81)
+
+    assert protocol.decode_time(protocol.encode_time(None)) is None
+    assert protocol.decode_time(protocol.encode_time(1.5)) == 1.5
+    assert protocol.encode_time(-1) == 0
+    # Never NO_TIME by accident
+    assert protocol.encode_time(1e12) == protocol.NO_TIME - 1
+
+def test_unknown_frame_type():
+    with pytest.raises(ValueError):
+        protocol.parse(bytes((99, 0)))
+
+def test_handshake():
+    assert protocol.handshake(1) == bytes((protocol.ACK,))
+    assert protocol.handshake(2) == bytes((protocol.ACK_V2, 2))
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    yield Connection(a, size=16), b
+    a.close()
+    b.close()
+
+def test_frames_read_whole_or_split(pair):
+    conn, other = pair
+    frames = [protocol.turn(1, (3, 3), 5, None), protocol.move((0, 1)), protocol.game_over(0, 0, None)]
+    data = b''.join(frames)
+    # All at once, then a byte at a time (frames straddle the 16 byte buffer)
+    other.sendall(data)
+    for sent in frames:
+        assert protocol.recv_frame(conn) == protocol.parse(sent[1:])
+    for byte in data:
+        other.sendall(bytes((byte,)))
+    for sent in frames:
+        assert protocol.recv_frame(conn) == protocol.parse(sent[1:])
+
+def test_queued_frames_go_out_on_flush(pair):
+    conn, other = pair
+    conn.send(protocol.move((1, 1)))
+    conn.send(protocol.move((2, 2)))
+    other.setblocking(False)
+    with pytest.raises(BlockingIOError):
+        other.recv(64)
+    conn.flush()
+    other.setblocking(True)
+    assert other.recv(64) == protocol.move((1, 1)) + protocol.move((2, 2))
+
+def test_closed_connection(pair):
+    conn, other = pair
+    other.sendall(protocol.move((1, 1))[:1])
+    other.close()
+    with pytest.raises(ConnectionError):
+        conn.recv_frame()
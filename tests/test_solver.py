@@ -0,0 +1,71 @@
+"""
+The endgame solver against a plain minimax over the whole remaining game.
+
+Run with: python -m pytest tests
+"""
+import random
+import pytest
+from board import Board
+from bots.solver import Solver, WIN, DRAW, LOSS
+
+def minimax(board):
+    # Value of the board for the player to move, with no pruning or table
+    player = board.player
+    best = LOSS
+    for move in board.get_valid():
+        winner = board.push(*move)
+        if winner is None:
+            value = -minimax(board)
+        elif winner == 0:
+            value = DRAW
+        else:
+            value = WIN if winner == player else LOSS
+        board.pop()
+        best = max(best, value)
+        if best == WIN:
+            break
+    return best
+
+def endgame(seed, empty):
+    # A random game played until at most empty cells are left
+    rng = random.Random(seed)
+    while True:
+        board = Board()
+        while board.winner is None and board.turns_left > empty:
+            board.move(*rng.choice(board.get_valid()))
+        if board.winner is None:
+            return board
+
+@pytest.mark.parametrize('seed', range(40))
+def test_values_match_minimax(seed):
+    board = endgame(seed, 10)
+    before = board.snapshot()
+    value, move = Solver().solve(board)
+    assert board.snapshot() == before
+    assert value == minimax(board)
+
+    # The move keeps the value
+    winner = board.push(*move)
+    if winner is None:
+        assert -minimax(board) == value
+    else:
+        assert value == (DRAW if winner == 0 else WIN)
+
+def test_table_is_reused_between_solves():
+    solver = Solver()
+    board = endgame(7, 16)
+    first = solver.solve(board)
+    nodes = solver.nodes
+    assert solver.solve(board) == first
+    assert solver.nodes < nodes
+
+def test_gives_up_when_out_of_time():
+    board = endgame(1, 60)
+    before = board.snapshot()
+    assert Solver().solve(board, 0) is None
+    assert board.snapshot() == before
+
+def test_worth_trying():
+    solver = Solver(max_empty=24, max_moves=4, max_constrained_empty=28)
+    assert not solver.worth_trying(Board())
+    assert solver.worth_trying(endgame(2, 24))
@@ -0,0 +1,137 @@
+"""
+Time controls, with a fake time source so nothing depends on how fast
+the machine is: the bots' Clock, and the host's move limit and game clock.
+
+Run with: python -m pytest tests
+"""
+import time as real_time
+import pytest
+
+import client
+import server
+import transport
+from board import Board
+from bots import clock as clock_module
+from bots.base_bot import BaseBot
+from bots.clock import Clock
+
+class FakeTime:
+    # Real time plus the seconds the test has skipped ahead
+    def __init__(self):
+        self.offset = 0.0
+
+    def time(self):
+        return real_time.time() + self.offset
+
+    def sleep(self, seconds):
+        self.offset += seconds
+
+    def skip(self, seconds):
+        self.offset += seconds
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(clock_module, 'time', fake.time)
+    monkeypatch.setattr(clock_module, 'sleep', fake.sleep)
+    monkeypatch.setattr(server, 'time', fake)
+    return fake
+
+def near(a, b):
+    return abs(a - b) < 0.01
+
+def test_reserve_is_a_tenth_of_the_limit_within_bounds():
+    clock = Clock(reserve=0.5, min_reserve=0.1)
+    assert clock.held_back(100) == 0.5
+    assert near(clock.held_back(3), 0.3)
+    # At least min_reserve, or half of a very short limit
+    assert clock.held_back(0.3) == 0.1
+    assert clock.held_back(0.1) == 0.05
+
+def test_move_limit(fake_time):
+    clock = Clock(move_time=15)
+    clock.sync(None, 0.3)
+    start = clock.started()
+    assert near(clock.budget(Board()), 0.2)
+    assert near(clock.deadline(clock.budget(Board()), start) - start, 0.2)
+    assert near(clock.latest(start) - start, 0.2)
+
+def test_game_clock_is_shared_over_the_moves_left(fake_time):
+    clock = Clock(move_time=15, game_time=60)
+    board = Board()
+    # 81 // 3 = 27 of our moves left, with 0.5s held back
+    assert near(clock.budget(board), (60 - 0.5) / 27)
+    for _ in range(60):
+        board.move(*board.get_valid()[0])
+    # Never fewer than min_moves_left
+    assert near(clock.budget(board), (60 - 0.5) / 8)
+
+def test_charge_takes_the_time_used_off_the_clock(fake_time):
+    clock = Clock(move_time=15, game_time=60)
+    start = clock.started()
+    fake_time.skip(2)
+    report = clock.charge(start, 2.2, 'deadline')
+    assert near(report.used, 2)
+    assert near(clock.remaining, 58)
+    assert report.reason == 'deadline'
+    assert clock.reports == [report]
+
+def test_wait_charges_the_whole_budget(fake_time):
+    clock = Clock(move_time=15, game_time=60)
+    clock.sync(30, 1)
+    report = clock.wait(Board())
+    assert near(report.used, report.budget)
+    assert near(report.budget, 1 - 0.1)
+    assert near(clock.remaining, 30 - report.used)
+
+class SlowBot(BaseBot):
+    # Plays the first valid move, after taking seconds(move number)
+    # on the fake clock
+    def setup(self, fake_time, seconds):
+        self.fake_time = fake_time
+        self.seconds = seconds
+        self.moves = 0
+
+    def request(self):
+        self.moves += 1
+        self.fake_time.skip(self.seconds(self.moves))
+        return self.board.get_valid()[0]
+
+def host_game(fake_time, seconds1, seconds2, game_time=None, move_time=None):
+    # Plays a local game between two SlowBots, returning the host
+    link = transport.Local("time-controls-{}".format(id(fake_time)))
+    host = server.Server(Board(), transport=link, game_time=game_time,
+                         move_time=move_time, linger=0)
+    players = []
+    for seconds in (seconds1, seconds2):
+        player = client.Client(lambda number, seconds=seconds: SlowBot(Board(), number, fake_time, seconds),
+                               transport=link)
+        player.start(threaded=True)
+        players.append(player)
+    try:
+        host.start()
+    finally:
+        host.close()
+        for player in players:
+            player.join()
+    return host
+
+def test_host_forfeits_a_move_over_the_limit(fake_time, capsys):
+    host = host_game(fake_time, lambda move: 0.5 if move == 2 else 0.1, lambda move: 0.1,
+                     move_time=0.3)
+    assert host.winner == 2
+    # Player 1's second move was the third of the game, and never played
+    assert host._board.turns_left == 81 - 2
+    assert host.latency[1].count == 2
+
+def test_host_forfeits_when_the_game_clock_runs_out(fake_time, capsys):
+    host = host_game(fake_time, lambda move: 0.3, lambda move: 0.1, game_time=1)
+    assert host.winner == 2
+    # Three moves each, then player 1 needs 0.3s with 0.1s left
+    assert host._board.turns_left == 81 - 6
+    assert host.clocks[1] < 0
+
+def test_host_plays_out_moves_within_the_limit(fake_time, capsys):
+    host = host_game(fake_time, lambda move: 0.25, lambda move: 0.25, move_time=0.3)
+    assert host._board.winner is not None
+    assert host.winner == host._board.winner
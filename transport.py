@@ -0,0 +1,199 @@
+"""
+Transports for the server and client.
+
+A transport knows where the host is: listen() gives the server
+something to accept() players from and connect() gives a client its
+end of the connection. Both ends behave like sockets (recv_into,
+sendall, settimeout, shutdown, close), so socket_helper.Connection
+works over any of them.
+
+    TCP(host, port)  INET sockets, the default
+    Unix(path)       AF_UNIX sockets, for players on the same machine
+    Local(name)      a pair of in-process queues per player, so bots can
+                     play in one process without any sockets
+
+local_match plays two bots against each other over a Local transport.
+"""
+import contextlib
+import itertools
+import os
+import queue
+import socket
+import sys
+import threading
+
+class TCP:
+    def __init__(self, host=None, port=11001):
+        if host is None:
+            host = socket.gethostname()
+        self.host = host
+        self.port = port
+
+    def __str__(self):
+        return "{}:{}".format(self.host, self.port)
+
+    def listen(self, backlog=2):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(backlog)
+        return sock
+
+    def connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.host, self.port))
+        return sock
+
+class Unix:
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return "unix:{}".format(self.path)
+
+    def listen(self, backlog=2):
+        # Clear a socket file left behind by an earlier host
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.listen(backlog)
+        return sock
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+class Local:
+    # Listening hosts in this process, by name
+    _listeners = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name='uttt'):
+        self.name = name
+
+    def __str__(self):
+        return "local:{}".format(self.name)
+
+    def listen(self, backlog=2):
+        with Local._lock:
+            if self.name in Local._listeners:
+                raise OSError("Local host '{}' is already listening".format(self.name))
+            listener = Local._listeners[self.name] = LocalListener(self.name)
+        return listener
+
+    def connect(self):
+        with Local._lock:
+            listener = Local._listeners.get(self.name)
+        if listener is None:
+            raise ConnectionRefusedError("No local host '{}'".format(self.name))
+        ours, theirs = queue.Queue(), queue.Queue()
+        listener.pending.put((QueueSocket(theirs, ours), self.name))
+        return QueueSocket(ours, theirs)
+
+class LocalListener:
+    """ The host's side of a Local transport; accept() hands out players """
+    def __init__(self, name):
+        self.name = name
+        self.pending = queue.Queue()
+
+    def accept(self):
+        return self.pending.get()
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        with Local._lock:
+            if Local._listeners.get(self.name) is self:
+                del Local._listeners[self.name]
+
+class QueueSocket:
+    """
+    One end of an in-process connection: sendall puts bytes on the
+    outgoing queue and recv_into takes them off the incoming one.
+    None on a queue marks the end of the stream.
+    """
+    def __init__(self, incoming, outgoing):
+        self._incoming = incoming
+        self._outgoing = outgoing
+        self._pending = b''
+        self._timeout = None
+        self._eof = False
+        self._shut = False
+
+    def recv_into(self, view):
+        if not self._pending:
+            if self._eof:
+                return 0
+            try:
+                chunk = self._incoming.get(timeout=self._timeout)
+            except queue.Empty:
+                raise socket.timeout("timed out")
+            if chunk is None:
+                self._eof = True
+                return 0
+            self._pending = chunk
+        n = min(len(view), len(self._pending))
+        view[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def sendall(self, data):
+        if self._shut:
+            raise BrokenPipeError("Connection closed")
+        self._outgoing.put(bytes(data))
+
+    def settimeout(self, seconds):
+        self._timeout = seconds
+
+    def shutdown(self, how):
+        if how != socket.SHUT_RD and not self._shut:
+            self._shut = True
+            self._outgoing.put(None)
+
+    def close(self):
+        self.shutdown(socket.SHUT_RDWR)
+
+_matches = itertools.count(1)
+
+def local_match(bot1, bot2, game_time=None, move_time=None, quiet=True):
+    """
+    Play a game between two bots in this process, with no sockets.
+    The bots are (name, args) pairs for bots.get_bot, and bot1 moves first.
+    Returns the winner (0 for a tie). Raises if a bot cannot be set up
+    or fails during the game.
+    """
+    import bots
+    import client
+    import server
+    from board import Board
+
+    transport = Local("match-{}-{}".format(os.getpid(), next(_matches)))
+    out = open(os.devnull, 'w') if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        # Set the bots up here rather than in the client threads, so a
+        # bad spec raises to the caller instead of killing its thread
+        # (the host numbers the players in the order they connect)
+        made = [bots.get_bot(name)(Board(), number, *args)
+                for number, (name, args) in enumerate((bot1, bot2), 1)]
+        host = server.Server(Board(), transport=transport, game_time=game_time,
+                             move_time=move_time, linger=0)
+        clients = []
+        for bot in made:
+            def make(player, bot=bot):
+                assert player == bot.player, "Expected to be player {}, got {}".format(bot.player, player)
+                return bot
+            player = client.Client(make, transport=transport)
+            player.start(threaded=True)
+            clients.append(player)
+        try:
+            host.start()
+        finally:
+            host.close()
+            for player in clients:
+                player.join()
+    if quiet:
+        out.close()
+    return host.winner
@@ -1,5 +1,23 @@
 import numpy as np
 
+# 9-bit masks of the eight lines in a 3x3 board,
+# where cell (r, c) is bit 3*r + c
+LINES = (0o007, 0o070, 0o700, 0o111, 0o222, 0o444, 0o421, 0o124)
+FULL = 0o777
+
+# Lookup tables indexed by a 9-bit mask.
+# WINS[mask] is True if the mask covers a line,
+# FULLS[mask] is True if every cell is covered.
+WINS = tuple(any(mask & line == line for line in LINES) for mask in range(512))
+FULLS = tuple(mask == FULL for mask in range(512))
+
+# NumPy copies of the tables for the batched functions
+WIN_ARRAY = np.array(WINS, dtype=bool)
+FULL_ARRAY = np.array(FULLS, dtype=bool)
+
+# Weight of each cell of a flattened 3x3 board in its mask
+POWERS = 1 << np.arange(9)
+
 def winner(board):
     # Assumes the game is over and determines the winner
     win = winning_state(board, 1)
@@ -18,18 +36,11 @@ def full_winner(board):
 
 def winning_state(board, player):
     # check if a state is winning for the given player
-    for i in range(3):
-        if (board[:, i] == player).all():
-            return player
-        if (board[i, :] == player).all():
-            return player
-    if board[1,1] == player:
-        if board[0,0] == board[1,1] == board[2,2]:
-            return player
-        if board[0,2] == board[1,1] == board[2,0]:
-            return player
-
-    if (board != 0).all():
+    cells = np.asarray(board).ravel()
+    if WINS[int(POWERS @ (cells == player))]:
+        return player
+
+    if FULLS[int(POWERS @ (cells != 0))]:
         return 3
 
     return 0
@@ -41,4 +52,51 @@ def full_board_winning_state(board, player):
         for bc in range(3):
             miniboard = board[3*br:3*(br+1), 3*bc:3*(bc+1)]
             miniwins[br,bc] = winning_state(miniboard, player) | winning_state(miniboard, opp)
-    return winning_state(miniwins, player)
\ No newline at end of file
+    return winning_state(miniwins, player)
+
+# Batched scoring
+
+def masks(cells, player):
+    # 9-bit masks of the player's cells for a (..., 9) stack of boards
+    return (cells == player) @ POWERS
+
+def results(cells):
+    """
+    Results of a (..., 9) stack of flattened 3x3 boards:
+    0 if open, 1 or 2 if exactly one player has a line, and 3 otherwise.
+    Cells holding anything other than 1 or 2 (eg. a tied board) belong to nobody.
+    """
+    win1 = WIN_ARRAY[masks(cells, 1)]
+    win2 = WIN_ARRAY[masks(cells, 2)]
+    full = (cells != 0).all(-1)
+    state = np.where(full | (win1 & win2), 3, 0)
+    state[win1 & ~win2] = 1
+    state[win2 & ~win1] = 2
+    return state
+
+def winners(boards):
+    """
+    Winners of an (N, 3, 3) stack of final 3x3 boards: 1 or 2 if only
+    that player has a line, else 0 (a tie, or both players have a line)
+    """
+    boards = np.asarray(boards)
+    state = results(boards.reshape(len(boards), 9))
+    return np.where(state == 3, 0, state)
+
+def full_winners(boards):
+    """
+    Winners of an (N, 9, 9) stack of final states.
+    Each mini-board is scored with `results`, then the 3x3 board of
+    mini-board results is scored the same way as `winners`.
+    """
+    boards = np.asarray(boards)
+    # (N, row, col) -> (N, board, cell)
+    cells = boards.reshape(len(boards), 3, 3, 3, 3).transpose(0, 1, 3, 2, 4).reshape(len(boards), 9, 9)
+    state = results(results(cells))
+    return np.where(state == 3, 0, state)
+
+def random_fill(state, n=1):
+    # Stack of n copies of the state with every empty cell given to a random player
+    state = np.asarray(state)
+    fill = np.random.randint(1, 3, (n,) + state.shape)
+    return state + fill*(state == 0)